@@ -0,0 +1,95 @@
+"""
+Compares memory and time of building `Birthday` objects for a listing.
+
+The legacy path is the former `list_birthdays` implementation: a pandas DataFrame iterated with
+`iterrows()` into `Birthday` objects with a per-instance `__dict__`. The current path builds slotted
+`Birthday` objects from the tuples of the birthday store.
+
+Run from the repository root: `python -m benchmarks.bench_birthday_model [rows]`
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+from daos.birthday_calendar import Birthday
+from daos.birthday_store import BirthdayStore
+from utils import datetime_tools
+
+
+class LegacyBirthday:
+    """`Birthday` as it was before it used `__slots__`."""
+    def __init__(self, name, date, guild_id):
+        self.name = name
+        self._date = date
+        self.guild_id = guild_id
+
+
+class ListStorage:
+    """Storage backend stub serving generated rows from memory."""
+    def __init__(self, rows):
+        self.rows = rows
+
+    def load_birthdays(self):
+        return self.rows
+
+
+def make_rows(rows: int, guild_id: int = 1, seed: int = 0) -> list[tuple[str, str, int]]:
+    rng = random.Random(seed)
+    return [(f"Person {i}",
+             f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(1950, 2020)}",
+             guild_id)
+            for i in range(rows)]
+
+
+def legacy_path(df, guild_id):
+    df = df[df["guild_id"] == guild_id].copy()
+    df["days_left"] = df["date"].apply(datetime_tools.days_until_yearday)
+    df = df.sort_values(by=["days_left", "name"]).reset_index(drop=True)
+    return [LegacyBirthday(row["name"], row["date"], guild_id) for _, row in df.iterrows()]
+
+
+def current_path(store, guild_id):
+    return [Birthday(name, date, guild_id, days_left)
+            for name, date, days_left in store.sorted_by_days_left(guild_id)]
+
+
+def _measure(func, *args) -> tuple[float, int, int]:
+    """Returns duration (seconds), peak of allocated memory while running and memory still held by the result."""
+    start = time.perf_counter()
+    func(*args)
+    duration = time.perf_counter() - start
+
+    # Measured in a second run, tracing allocations slows down the function a lot
+    tracemalloc.start()
+    result = func(*args)
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return duration, peak, held
+
+
+def _print(label, rows, duration, peak, held):
+    print(f"{label:<8} {duration * 1000:8.1f} ms {rows / duration:10.0f} rows/s "
+          f"peak {peak / 2**20:7.1f} MiB  result {held / 2**20:7.1f} MiB")
+
+
+def main(rows: int = 100_000):
+    data = make_rows(rows)
+    print(f"rows: {rows}")
+
+    try:
+        import pandas as pd
+    except ImportError:
+        print("legacy   skipped (pandas is not installed)")
+    else:
+        df = pd.DataFrame(data, columns=["name", "date", "guild_id"])
+        _print("legacy", rows, *_measure(legacy_path, df, 1))
+
+    store = BirthdayStore(ListStorage(data))
+    store.load()
+    _print("current", rows, *_measure(current_path, store, 1))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
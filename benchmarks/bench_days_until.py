@@ -0,0 +1,71 @@
+"""
+Compares the per-row and the vectorized calculation of days left until birthdays.
+
+Run from the repository root: `python -m benchmarks.bench_days_until [rows]`
+"""
+import random
+import sys
+import time
+from datetime import date as Date
+
+from utils import datetime_tools
+
+
+def make_dates(rows: int, seed: int = 0) -> list[str]:
+    """Generates `rows` random birthday dates as strings in the date format from config.py."""
+    rng = random.Random(seed)
+    return [f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(1950, 2020)}"
+            for _ in range(rows)]
+
+
+def legacy_days_until_yearday(date: str, today: Date) -> int:
+    """
+    `datetime_tools.days_until_yearday` as it was before it used the lookup table.
+
+    `today` is passed in instead of calling `datetime.today()`, so the results match the vectorized ones.
+    """
+    date = datetime_tools.string_to_datetime(date)
+    next_date = datetime_tools.celebration_date(date.month, date.day, today.year)
+    if (next_date - today).days < 0:
+        next_date = datetime_tools.celebration_date(date.month, date.day, today.year + 1)
+    return (next_date - today).days
+
+
+def per_row(dates: list[str], today: Date) -> list[int]:
+    """One call per row, like `df["date"].apply(datetime_tools.days_until_yearday)`."""
+    return [legacy_days_until_yearday(date, today) for date in dates]
+
+
+def vectorized(months: list[int], days: list[int], today: Date) -> list[int]:
+    return datetime_tools.days_until_yeardays(months, days, today)
+
+
+def _timed(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(rows: int = 100_000):
+    dates = make_dates(rows)
+    # Parsed once on load, like the month and day columns of the birthday store
+    parsed = [datetime_tools.string_to_datetime(date) for date in dates]
+    months = [date.month for date in parsed]
+    days = [date.day for date in parsed]
+
+    today = datetime_tools.current_date()
+
+    assert per_row(dates, today) == vectorized(months, days, today)
+
+    t_per_row = _timed(per_row, dates, today)
+    t_vectorized = _timed(vectorized, months, days, today)
+    print(f"rows: {rows}")
+    print(f"per row:    {t_per_row * 1000:8.1f} ms")
+    print(f"vectorized: {t_vectorized * 1000:8.1f} ms ({t_per_row / t_vectorized:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
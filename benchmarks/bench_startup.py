@@ -0,0 +1,41 @@
+"""
+Measures import time and memory (max RSS) of the bot start-up, i.e. of importing `main.py`.
+
+Every measurement runs in a fresh interpreter, so nothing is cached between the runs.
+Run from the repository root: `python -m benchmarks.bench_startup [runs]`
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+_CHILD = """
+import resource, time
+start = time.perf_counter()
+import main
+duration = time.perf_counter() - start
+print(duration, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "pandas" in __import__("sys").modules)
+"""
+
+
+def measure_once() -> tuple[float, int, bool]:
+    """Returns import duration (seconds), max RSS (KiB) and whether pandas was imported."""
+    env = dict(os.environ, DISCORD_TOKEN=os.environ.get("DISCORD_TOKEN", "benchmark"))
+    output = subprocess.run([sys.executable, "-c", _CHILD], env=env, check=True,
+                            capture_output=True, text=True).stdout.split()
+    return float(output[0]), int(output[1]), output[2] == "True"
+
+
+def main(runs: int = 5):
+    results = [measure_once() for _ in range(runs)]
+    durations = [duration for duration, _, _ in results]
+    rss = [rss for _, rss, _ in results]
+
+    print(f"runs: {runs}, pandas imported: {results[0][2]}")
+    print(f"import main: median {statistics.median(durations) * 1000:.0f} ms, "
+          f"min {min(durations) * 1000:.0f} ms")
+    print(f"max RSS:     median {statistics.median(rss) / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
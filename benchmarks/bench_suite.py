@@ -0,0 +1,312 @@
+"""
+Benchmark suite driving the hot paths of the bot against a generated dataset and fake Discord objects.
+
+The dataset (`dates.csv` and `subscriptions.csv`) is generated into a temporary directory that is used as working
+directory, so the bot reads it through the paths from config.py. For every scenario the throughput, the p50/p99
+latency of a single operation and the peak of memory allocated while it runs are reported.
+Results can be saved as baseline and later runs compared against it; the exit code is 1 if a scenario regressed.
+
+Run from the repository root:
+    python -m benchmarks.bench_suite --preset medium --save baseline.json
+    python -m benchmarks.bench_suite --preset medium --compare baseline.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+import daos.birthday_calendar as bc
+from daos.birthday_store import birthday_store
+from daos.csv_storage import CsvStorage  # noqa: F401, imported before leaving the repository directory
+from daos.subscriptions import Subscriptions
+from cogs.birthday_commands import BirthdayCommands
+from cogs.subscription_commands import SubscriptionCommands
+from utils import datetime_tools, fanout
+from benchmarks.datasets import write_dataset
+from benchmarks.fakes import FakeChannel, FakeGuild, FakeInteraction
+
+# Number of birthdays, guilds and subscribed channels
+PRESETS = {
+    "small": (1_000, 10, 10),
+    "medium": (100_000, 1_000, 1_000),
+    "large": (1_000_000, 10_000, 10_000),
+}
+
+
+@dataclass
+class Result:
+    scenario: str
+    ops: int
+    duration: float
+    p50: float
+    p99: float
+    peak: int
+
+    @property
+    def throughput(self) -> float:
+        return self.ops / self.duration if self.duration > 0 else 0.0
+
+
+class Context:
+    """Objects shared by the scenarios."""
+    def __init__(self, guilds: int, channels: int, samples: int, send_latency: float, seed: int):
+        self.rng = random.Random(seed)
+        self.guilds = {guild_id: FakeGuild(guild_id) for guild_id in range(1, guilds + 1)}
+        # Same ids as the generated subscriptions
+        self.channels = [FakeChannel(1_000_001 + i, self.guilds[i % guilds + 1], send_latency)
+                         for i in range(channels)]
+        self.sample_guilds = [self.rng.randint(1, guilds) for _ in range(samples)]
+        self.birthday_cog = BirthdayCommands(bot=None)
+
+    def sample_names(self) -> list[tuple[int, str]]:
+        """One stored name per sampled guild (guilds without entries are skipped)."""
+        names = []
+        for guild_id in self.sample_guilds:
+            entries = birthday_store.entries(guild_id)
+            if entries:
+                names.append((guild_id, self.rng.choice(entries)[0]))
+        return names
+
+
+async def load_store(ctx: Context) -> tuple[int, float, list[float]]:
+    start = time.perf_counter()
+    birthday_store.load()
+    elapsed = time.perf_counter() - start
+    return 1, elapsed, [elapsed]
+
+
+async def load_subscriptions(ctx: Context) -> tuple[int, float, list[float]]:
+    start = time.perf_counter()
+    await Subscriptions.all()
+    elapsed = time.perf_counter() - start
+    return 1, elapsed, [elapsed]
+
+
+async def render_page(ctx: Context) -> tuple[int, float, list[float]]:
+    latencies = []
+    for guild_id in ctx.sample_guilds:
+        cal = bc.BirthdayCalendar(guild_id)
+        cal._invalidate_rendered_tables()
+        start = time.perf_counter()
+        await cal.render_birthdays_page(1)
+        latencies.append(time.perf_counter() - start)
+    return len(latencies), sum(latencies), latencies
+
+
+async def render_page_cached(ctx: Context) -> tuple[int, float, list[float]]:
+    for guild_id in ctx.sample_guilds:
+        await bc.BirthdayCalendar(guild_id).render_birthdays_page(1)
+
+    latencies = []
+    for guild_id in ctx.sample_guilds:
+        start = time.perf_counter()
+        await bc.BirthdayCalendar(guild_id).render_birthdays_page(1)
+        latencies.append(time.perf_counter() - start)
+    return len(latencies), sum(latencies), latencies
+
+
+async def make_output_table(ctx: Context) -> tuple[int, float, list[float]]:
+    pages = [await bc.BirthdayCalendar(guild_id).get_birthdays_page(1, 10) for guild_id in ctx.sample_guilds]
+
+    latencies = []
+    for page in pages:
+        start = time.perf_counter()
+        bc.make_output_table(page)
+        latencies.append(time.perf_counter() - start)
+    return len(latencies), sum(latencies), latencies
+
+
+async def lookup(ctx: Context) -> tuple[int, float, list[float]]:
+    latencies = []
+    for guild_id, name in ctx.sample_names():
+        start = time.perf_counter()
+        await bc.BirthdayCalendar(guild_id).get_birthday(name)
+        latencies.append(time.perf_counter() - start)
+    return len(latencies), sum(latencies), latencies
+
+
+async def add_and_remove(ctx: Context) -> tuple[int, float, list[float]]:
+    latencies = []
+    for i, guild_id in enumerate(ctx.sample_guilds):
+        cal = bc.BirthdayCalendar(guild_id)
+        start = time.perf_counter()
+        await cal.lookup_or_add(f"Benchmark {i}", "01.01.2000")
+        await cal.remove_entry(f"Benchmark {i}")
+        latencies.append(time.perf_counter() - start)
+    return len(latencies), sum(latencies), latencies
+
+
+async def command_birthdays(ctx: Context) -> tuple[int, float, list[float]]:
+    latencies = []
+    for guild_id in ctx.sample_guilds:
+        inter = FakeInteraction(FakeChannel(0, ctx.guilds[guild_id]))
+        start = time.perf_counter()
+        await ctx.birthday_cog.birthdays.callback(ctx.birthday_cog, inter, page=1)
+        latencies.append(time.perf_counter() - start)
+    return len(latencies), sum(latencies), latencies
+
+
+async def command_birthday(ctx: Context) -> tuple[int, float, list[float]]:
+    latencies = []
+    for guild_id, name in ctx.sample_names():
+        inter = FakeInteraction(FakeChannel(0, ctx.guilds[guild_id]))
+        start = time.perf_counter()
+        await ctx.birthday_cog.birthday.callback(ctx.birthday_cog, inter, name=name, date="")
+        latencies.append(time.perf_counter() - start)
+    return len(latencies), sum(latencies), latencies
+
+
+async def daily_publish(ctx: Context) -> tuple[int, float, list[float]]:
+    bc.rendered_tables.invalidate(lambda key: True)
+    today = datetime_tools.current_date()
+    start = time.perf_counter()
+    # The messages are sent concurrently, so the throughput is based on the duration of the whole run
+    report = await SubscriptionCommands.publish_daily_birthdays([(channel, today) for channel in ctx.channels])
+    return report.sent, time.perf_counter() - start, report.latencies
+
+
+SCENARIOS = {
+    "load store": load_store,
+    "load subscriptions": load_subscriptions,
+    "render page": render_page,
+    "render page (cached)": render_page_cached,
+    "make_output_table": make_output_table,
+    "lookup": lookup,
+    "add and remove": add_and_remove,
+    "/birthdays": command_birthdays,
+    "/birthday": command_birthday,
+    "daily publish": daily_publish,
+}
+
+
+def percentile(latencies: list[float], percent: float) -> float:
+    if not latencies:
+        return 0.0
+    ordered = sorted(latencies)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+async def run_scenario(name: str, ctx: Context, repeat: int, memory: bool) -> Result:
+    """Runs the scenario `repeat` times and keeps the fastest run, then measures its peak memory in another run."""
+    scenario = SCENARIOS[name]
+    # The bot prints reports (e.g. of the daily publish), they are not part of the benchmark output
+    with contextlib.redirect_stdout(io.StringIO()):
+        runs = [await scenario(ctx) for _ in range(repeat)]
+        ops, elapsed, latencies = min(runs, key=lambda run: run[1])
+
+        # Measured in a separate run, tracing allocations slows down the scenario a lot
+        peak = 0
+        if memory:
+            tracemalloc.start()
+            await scenario(ctx)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return Result(name, ops, elapsed, percentile(latencies, 50), percentile(latencies, 99), peak)
+
+
+def print_results(results: list[Result], baseline: dict[str, dict] | None = None,
+                  threshold: float = 0.2, min_delta: float = 0.0001) -> bool:
+    """
+    Prints the results as table, compared to the baseline if one is given.
+
+    A scenario regressed if its p99 latency or its mean time per operation grew by more than `threshold`
+    (relative) and by more than `min_delta` seconds, so the jitter of operations taking microseconds is ignored.
+
+    Returns:
+        `True` if a scenario regressed compared to the baseline.
+    """
+    regressed = False
+    print(f"{'scenario':<22} {'ops':>8} {'ops/s':>12} {'p50 ms':>10} {'p99 ms':>10} {'peak MiB':>9}")
+    for result in results:
+        print(f"{result.scenario:<22} {result.ops:>8} {result.throughput:>12.0f} {result.p50 * 1000:>10.3f} "
+              f"{result.p99 * 1000:>10.3f} {result.peak / 2**20:>9.1f}", end="")
+
+        old = (baseline or {}).get(result.scenario)
+        if old is None:
+            print()
+            continue
+        old = Result(**old)
+        slower = any(new > old_value * (1 + threshold) and new - old_value > min_delta
+                     for new, old_value in ((result.p99, old.p99),
+                                            (result.duration / result.ops, old.duration / old.ops)))
+        regressed = regressed or slower
+        print(f"   p99 {_change(result.p99, old.p99)}, ops/s {_change(result.throughput, old.throughput)}"
+              f"{'   REGRESSION' if slower else ''}")
+
+    return regressed
+
+
+def _change(new: float, old: float) -> str:
+    return f"{new / old - 1:+.0%}" if old else "n/a"
+
+
+async def run(args) -> list[Result]:
+    birthdays, guilds, channels = PRESETS[args.preset]
+    birthdays = args.birthdays or birthdays
+    guilds = args.guilds or guilds
+    channels = args.channels or channels
+    print(f"birthdays: {birthdays}, guilds: {guilds}, channels: {channels}, samples: {args.samples}")
+
+    write_dataset("data", birthdays, guilds, channels, args.seed)
+    # Measure the publish path itself, not the rate limit that protects Discord
+    fanout.publish_limiter = fanout.TokenBucket(args.rate)
+
+    ctx = Context(guilds, channels, args.samples, args.send_latency, args.seed)
+    names = args.scenario or list(SCENARIOS)
+    return [await run_scenario(name, ctx, args.repeat, not args.no_memory) for name in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--preset", choices=PRESETS, default="small")
+    parser.add_argument("--birthdays", type=int, help="number of birthdays (overrides the preset)")
+    parser.add_argument("--guilds", type=int, help="number of guilds (overrides the preset)")
+    parser.add_argument("--channels", type=int, help="number of subscribed channels (overrides the preset)")
+    parser.add_argument("--samples", type=int, default=200, help="operations per scenario")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the fastest one is reported")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="seconds a fake send takes")
+    parser.add_argument("--rate", type=float, default=1e9, help="publish rate limit (messages per second)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these scenarios")
+    parser.add_argument("--no-memory", action="store_true", help="skip measuring the peak memory")
+    parser.add_argument("--save", help="save the results as baseline to this JSON file")
+    parser.add_argument("--compare", help="compare the results to the baseline in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown compared to the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1,
+                        help="slowdowns below this many milliseconds per operation are ignored")
+    args = parser.parse_args()
+
+    # Relative to the directory the benchmark was started in
+    save = os.path.abspath(args.save) if args.save else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        results = asyncio.run(run(args))
+
+    regressed = print_results(results, baseline, args.threshold, args.min_delta_ms / 1000)
+
+    if save:
+        with open(save, "w") as baseline_file:
+            json.dump({"args": vars(args), "results": {result.scenario: asdict(result) for result in results}},
+                      baseline_file, indent=2)
+        print(f"Saved results to {save}")
+
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Generators for synthetic birthdays and subscriptions in the file format of the CSV storage backend.
+
+The generated data is deterministic for a given seed, so results of different runs are comparable.
+"""
+import csv
+import os
+import random
+
+# Subscriptions are spread over a few publish times and timezones, like real guilds would choose them
+_PUBLISH_TIMES = ("07:00", "08:00", "08:00", "09:00", "12:00")
+_TIMEZONES = ("Europe/Berlin", "Europe/Berlin", "Europe/London", "America/New_York", "Asia/Tokyo")
+
+
+def make_birthdays(count: int, guilds: int, seed: int = 0) -> list[tuple[str, str, int]]:
+    """
+    Generates `count` birthdays spread randomly over `guilds` guilds (ids 1 to `guilds`).
+
+    Returns:
+        List of `(name, date, guild_id)` tuples with the date in the format from config.py.
+    """
+    rng = random.Random(seed)
+    return [(f"Person {i}",
+             f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(1950, 2020)}",
+             rng.randint(1, guilds))
+            for i in range(count)]
+
+
+def make_subscriptions(channels: int, guilds: int, seed: int = 0) -> list[tuple[int, int, str, str]]:
+    """
+    Generates `channels` subscribed channels (ids from 1000001), every guild gets at least one if possible.
+
+    Returns:
+        List of `(channel_id, guild_id, publish_time, timezone)` tuples.
+    """
+    rng = random.Random(seed)
+    return [(1_000_001 + i,
+             i % guilds + 1,
+             rng.choice(_PUBLISH_TIMES),
+             rng.choice(_TIMEZONES))
+            for i in range(channels)]
+
+
+def write_dataset(directory: str, birthdays: int, guilds: int, channels: int, seed: int = 0) -> None:
+    """
+    Writes `dates.csv` and `subscriptions.csv` with generated data to `directory`.
+
+    Args:
+        directory: target directory, created if it does not exist
+        birthdays: number of birthdays
+        guilds: number of guilds the birthdays and subscriptions are spread over
+        channels: number of subscribed channels
+        seed: seed of the random generator
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, "dates.csv"), "w", newline="") as dates_file:
+        writer = csv.writer(dates_file, lineterminator="\n")
+        writer.writerow(["name", "date", "guild_id"])
+        writer.writerows(make_birthdays(birthdays, guilds, seed))
+
+    with open(os.path.join(directory, "subscriptions.csv"), "w", newline="") as subscriptions_file:
+        writer = csv.writer(subscriptions_file, lineterminator="\n")
+        writer.writerow(["channel_id", "guild_id", "publish_time", "timezone", "last_published", "reminder_days"])
+        writer.writerows((*subscription, "", "") for subscription in make_subscriptions(channels, guilds, seed))
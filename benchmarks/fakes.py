@@ -0,0 +1,49 @@
+"""
+Stand-ins for the disnake objects the bot uses, so commands and the daily publish run without Discord.
+
+Only the attributes and methods the bot actually uses are implemented.
+"""
+import asyncio
+import itertools
+
+_interaction_ids = itertools.count(1)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+
+class FakeChannel:
+    """Text channel whose `send` takes `latency` seconds and only counts the messages."""
+    def __init__(self, channel_id: int, guild: FakeGuild, latency: float = 0.0):
+        self.id = channel_id
+        self.guild = guild
+        self.latency = latency
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+
+class FakeResponse:
+    async def defer(self, **kwargs):
+        pass
+
+    async def edit_message(self, content=None, **kwargs):
+        pass
+
+
+class FakeInteraction:
+    """Slash command interaction in the given channel, keeps the sent messages in `sent`."""
+    def __init__(self, channel: FakeChannel):
+        self.id = next(_interaction_ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.response = FakeResponse()
+        self.sent: list[str] = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
@@ -1,8 +1,11 @@
+import io
+
 import disnake
 from disnake.ext import commands
 
-from utils import datetime_tools
+from utils import calendar_files, datetime_tools, subscriptions_controller
 import daos.birthday_calendar as bc
+from config import BIRTHDAYS_PAGE_SIZE, NAME_MAX_LENGTH
 
 
 class BirthdayCommands(commands.Cog):
@@ -11,16 +14,28 @@ class BirthdayCommands(commands.Cog):
         self.bot = bot
 
     @commands.slash_command()
-    async def birthdays(self, inter: disnake.ApplicationCommandInteraction):
+    async def birthdays(self,
+                        inter: disnake.ApplicationCommandInteraction,
+                        page: int = commands.Param(default=1, ge=1)
+                        ):
         """Sends back a list of the all birthdays associated to the guild derived by the interaction (context)."""
         """
+        Only one page of the list is rendered and sent. Buttons below the message switch to the other pages.
+
         Args:
             inter: disnake.ApplicationCommandInteraction object
+            page (default: 1): number of the page to start with
         """
-        date_list = await bc.BirthdayCalendar(inter.guild.id).list_birthdays()
+        # Zähle die verbleibenden Tage ab dem heutigen Datum in der Zeitzone des Servers
+        cal = bc.BirthdayCalendar(inter.guild.id, subscriptions_controller.guild_timezone(inter.guild.id))
+        page_count = await cal.page_count(BIRTHDAYS_PAGE_SIZE)
+        page = min(page, page_count)
 
-        output = bc.make_output_table(date_list)
-        await inter.send(f"Geburtstage:\n```\n{output}\n```")
+        content = await _birthdays_page_message(cal, page, page_count)
+        if page_count > 1:
+            await inter.send(content, view=BirthdayPages(cal, page, page_count))
+        else:
+            await inter.send(content)
 
     @commands.slash_command()
     async def birthday(self,
@@ -38,39 +53,44 @@ class BirthdayCommands(commands.Cog):
             name: name of the person the birthday should be fetched or stored
             date (default: None): date of the birthday that should be stored
         """
-        # Erstelle Instanz eines Kalenders für die gegebene guild_id
-        cal = bc.BirthdayCalendar(inter.guild.id)
+        # Längere Namen können weder vorgeschlagen noch in einer Seite von `/birthdays` angezeigt werden
+        if len(name) > NAME_MAX_LENGTH:
+            await inter.send(f"Der Name darf höchstens {NAME_MAX_LENGTH} Zeichen lang sein.")
+            return
+
+        # Erstelle Instanz eines Kalenders für die gegebene guild_id (in der Zeitzone ihrer Abonnements)
+        cal = bc.BirthdayCalendar(inter.guild.id, subscriptions_controller.guild_timezone(inter.guild.id))
+
+        # Suche den Eintrag zum gegebenen Namen auf dem aktuellen Server (`guild_id`) und füge ihn im selben Schritt
+        # hinzu, falls er nicht existiert und ein gültiges Datum angegeben wurde.
+        valid_date = bool(date) and datetime_tools.check_date_format(date) # Empty string `""` is treated as `False`
+        status, birthday = await cal.lookup_or_add(name, date if valid_date else None)
 
-        # Checke ob zum gegebenen Namen auf dem aktuellen Server (`guild_id`) bereits ein Eintrag existiert.
-        # Falls nicht, füge diesen hinzu, falls ein Datum angegeben wurde.
-        if await cal.exists_entry(name):
+        if status == bc.EntryStatus.FOUND:
             # Falls ein Datum angegeben wurde, wird der bestehende Eintrag nicht überschrieben
-            if date: # Empty string `""` is treated as `False`
+            if date:
                 await inter.send(
                     f"Geburtstag von {name} schon gespeichert.\nZum Löschen verwende `/forgetbirthday {name}`"
                 )
             # Falls kein Datum angegeben wurde, sende den gespeicherten Geburtstag zurück
             else:
-                birthday = await cal.get_birthday(name)
                 output = bc.make_output_table_for_birthday(birthday)
                 await inter.send(f"Geburtstag:\n```\n{output}\n```")
+        elif status == bc.EntryStatus.ADDED:
+            output = bc.make_output_table_for_birthday(birthday)
+            await inter.send(
+                f"Geburtstag gespeichert:\n```\n{output}\n```")
+        elif date:
+            await inter.send(
+                f"Das Datum ist nicht im richtigen Format: TT.MM.YYYY")
+        # Falls kein Datum angegeben und kein name gefunden wurde, kann kein Geburtstag zurückgeschickt werden.
         else:
-            if date:
-                if datetime_tools.check_date_format(date):
-                    birthday = await cal.add_entry(name, date)
-                    output = bc.make_output_table_for_birthday(birthday)
-                    await inter.send(
-                        f"Geburtstag gespeichert:\n```\n{output}\n```")
-                else:
-                    await inter.send(
-                        f"Das Datum ist nicht im richtigen Format: TT.MM.YYYY")
-            # Falls kein Datum angegeben und kein name gefunden wurde, kann kein Geburtstag zurückgeschickt werden.
-            else:
-                await inter.send(
-                    f"Geburtstag von {name} konnte nicht gefunden werden.")
+            await inter.send(
+                f"Geburtstag von {name} konnte nicht gefunden werden.")
 
     @commands.slash_command()
-    async def forgetbirthday(inter: disnake.ApplicationCommandInteraction,
+    async def forgetbirthday(self,
+                             inter: disnake.ApplicationCommandInteraction,
                              name: str):
         """Removes the entry associated to the given name and guild derived from the interaction."""
         """
@@ -81,14 +101,114 @@ class BirthdayCommands(commands.Cog):
         # Erstelle Instanz eines Kalenders für die gegebene guild_id
         cal = bc.BirthdayCalendar(inter.guild.id)
 
-        # Checke ob zum gegebenen Namen auf dem aktuellen Server (`guild_id`) ein Eintrag existiert.
-        # Lösche den Eintrag nur, falls das der Fall ist.
-        if not await cal.exists_entry(name):
+        # Lösche den Eintrag zum gegebenen Namen auf dem aktuellen Server (`guild_id`), falls er existiert.
+        if await cal.remove_entry(name):
+            await inter.send(f"Geburtstag von {name} wurde gelöscht.")
+        else:
             await inter.send(
                 f"Geburtstag von {name} konnte nicht gefunden werden.")
+
+    @commands.slash_command()
+    async def importbirthdays(self,
+                              inter: disnake.ApplicationCommandInteraction,
+                              file: disnake.Attachment):
+        """Imports the birthdays from a CSV (columns name, date) or iCalendar (.ics) file."""
+        """
+        Entries for names that are stored already are kept and not overwritten.
+        All new entries are stored with a single write.
+
+        Args:
+            inter: disnake.ApplicationCommandInteraction object
+            file: uploaded CSV or iCalendar file
+        """
+        # Das Einlesen kann länger dauern als die Antwortfrist von Discord
+        await inter.response.defer()
+
+        cal = bc.BirthdayCalendar(inter.guild.id)
+
+        # Die Datei wird Zeile für Zeile geparst, ohne sie vorher vollständig zu dekodieren
+        lines = io.TextIOWrapper(io.BytesIO(await file.read()), encoding="utf-8-sig", errors="replace")
+        if file.filename.lower().endswith(".ics"):
+            entries = calendar_files.iter_ics_birthdays(lines)
         else:
-            await cal.remove_entry(name)
-            await inter.send(f"Geburtstag von {name} wurde gelöscht.")
+            entries = calendar_files.iter_csv_birthdays(lines)
+
+        added, skipped, invalid = await cal.import_entries(entries)
+        await inter.send(
+            f"Import abgeschlossen: {added} hinzugefügt, {skipped} übersprungen (schon gespeichert), "
+            f"{invalid} ungültig (Name fehlt oder ist länger als {NAME_MAX_LENGTH} Zeichen "
+            f"oder Datum nicht im Format TT.MM.YYYY).")
+
+    @commands.slash_command()
+    async def exportbirthdays(self,
+                              inter: disnake.ApplicationCommandInteraction,
+                              format: str = commands.Param(default="csv", choices=["csv", "ics"])
+                              ):
+        """Sends all birthdays of the guild as CSV or iCalendar (.ics) file."""
+        """
+        Args:
+            inter: disnake.ApplicationCommandInteraction object
+            format (default: csv): file format, `csv` or `ics`
+        """
+        cal = bc.BirthdayCalendar(inter.guild.id)
+        entries = await cal.export_entries()
+
+        if format == "ics":
+            lines = calendar_files.iter_ics_lines(entries, inter.guild.id)
+        else:
+            lines = calendar_files.iter_csv_lines(entries)
+
+        buffer = io.BytesIO()
+        for line in lines:
+            buffer.write(line.encode("utf-8"))
+        buffer.seek(0)
+
+        await inter.send(f"Geburtstage ({len(entries)} Einträge):",
+                         file=disnake.File(buffer, filename=f"birthdays.{format}"))
+
+    @birthday.autocomplete("name")
+    @forgetbirthday.autocomplete("name")
+    async def autocomplete_name(self, inter: disnake.ApplicationCommandInteraction, user_input: str):
+        """Suggests the stored names of the guild starting with what was typed so far."""
+        return await bc.BirthdayCalendar(inter.guild.id).find_names(user_input)
+
+
+class BirthdayPages(disnake.ui.View):
+    """Buttons to switch between the pages of the `/birthdays` list."""
+    def __init__(self, cal: bc.BirthdayCalendar, page: int, page_count: int):
+        super().__init__(timeout=180)
+        self.cal = cal
+        self.page = page
+        self.page_count = page_count
+        self._update_buttons()
+
+    @disnake.ui.button(label="◀", style=disnake.ButtonStyle.secondary)
+    async def previous_page(self, _button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        await self._show_page(inter, self.page - 1)
+
+    @disnake.ui.button(label="▶", style=disnake.ButtonStyle.secondary)
+    async def next_page(self, _button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        await self._show_page(inter, self.page + 1)
+
+    async def _show_page(self, inter: disnake.MessageInteraction, page: int):
+        # Entries may have been added or removed since the last page was shown
+        self.page_count = await self.cal.page_count(BIRTHDAYS_PAGE_SIZE)
+        self.page = max(1, min(page, self.page_count))
+        self._update_buttons()
+
+        content = await _birthdays_page_message(self.cal, self.page, self.page_count)
+        await inter.response.edit_message(content=content, view=self)
+
+    def _update_buttons(self):
+        self.previous_page.disabled = self.page <= 1
+        self.next_page.disabled = self.page >= self.page_count
+
+
+async def _birthdays_page_message(cal: bc.BirthdayCalendar, page: int, page_count: int) -> str:
+    output = await cal.render_birthdays_page(page, BIRTHDAYS_PAGE_SIZE)
+    if page_count > 1:
+        return f"Geburtstage (Seite {page}/{page_count}):\n```\n{output}\n```"
+    return f"Geburtstage:\n```\n{output}\n```"
 
 
 def setup(bot: commands.Bot):
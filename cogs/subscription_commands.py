@@ -1,10 +1,14 @@
+import functools
+import zoneinfo
+from datetime import date as Date
+
 import disnake
 from disnake.ext import commands
 from disnake.abc import GuildChannel
 
 import daos.birthday_calendar as bc
-from utils import subscriptions_controller
-from config import PUBLISH_BIRTHDAYS_TIME
+from config import DEFAULT_TIMEZONE, MAX_REMINDER_DAYS, MESSAGE_LENGTH_LIMIT, PUBLISH_BIRTHDAYS_TIME
+from utils import datetime_tools, fanout, metrics, subscriptions_controller
 
 
 class SubscriptionCommands(commands.Cog):
@@ -13,30 +17,85 @@ class SubscriptionCommands(commands.Cog):
         self.bot = bot
 
     @commands.slash_command()
-    async def subscribe(self, inter: disnake.ApplicationCommandInteraction):
-        """Schedules a job to be executed at PUBLISH_BIRTHDAYS_TIME from config.py."""
+    async def subscribe(self,
+                        inter: disnake.ApplicationCommandInteraction,
+                        time: str = commands.Param(default=PUBLISH_BIRTHDAYS_TIME),
+                        timezone: str = commands.Param(default=DEFAULT_TIMEZONE)
+                        ):
+        """Publishes todays birthdays in this channel every day at the given time (default from config.py)."""
         """
+        Calling the command again for a subscribed channel changes the time and timezone of the subscription.
+
         Args:
             inter: disnake.ApplicationCommandInteraction object
+            time (default: PUBLISH_BIRTHDAYS_TIME from config.py): time of day in format `"HH:MM"`
+            timezone (default: DEFAULT_TIMEZONE from config.py): IANA timezone like `"Europe/Berlin"`
         """
-        # Only add new subscription if channel is not subscribed yet
-        if not subscriptions_controller.is_scheduled(inter.channel.id):
-            await self.subscribe_channel(inter.channel)
+        if not datetime_tools.check_time_format(time):
+            await inter.send(f"The time has to be in the format HH:MM.")
+            return
+        if not datetime_tools.check_timezone(timezone):
+            await inter.send(f"Unknown timezone: {timezone}")
+            return
 
-            await inter.send(f"Subscription successful.")
+        settings = subscriptions_controller.get_settings(inter.channel.id)
+        # Only add new subscription if channel is not subscribed yet or the settings changed
+        if settings is None:
+            await self.subscribe_channel(inter.channel, time, timezone)
+
+            await inter.send(f"Subscription successful: daily at {time} ({timezone}).")
+        elif settings != (time, timezone):
+            await self.subscribe_channel(inter.channel, time, timezone)
+
+            await inter.send(f"Subscription changed: daily at {time} ({timezone}).")
         else:
             await inter.send(f"Already subscribed.")
 
+    @subscribe.autocomplete("timezone")
+    async def autocomplete_timezone(self, inter: disnake.ApplicationCommandInteraction, user_input: str):
+        """Suggests the IANA timezones containing what was typed so far."""
+        user_input = user_input.casefold()
+        return [timezone for timezone in _timezone_names() if user_input in timezone.casefold()][:25]
+
     @classmethod
-    async def subscribe_channel(cls, channel: GuildChannel):
+    async def subscribe_channel(cls, channel: GuildChannel, time: str, timezone: str):
         """
-        Schedules a job to be executed at PUBLISH_BIRTHDAYS_TIME from config.py.
+        Adds the channel to the channels the daily dispatcher publishes to at the given time.
 
         Args:
-            channel_id: discord.py channel
+            channel: discord.py channel
+            time: time of day in format `"HH:MM"`
+            timezone: IANA name of the timezone of `time`
         """
-        subscriptions_controller.new_task(channel, cls.publish_daily_birthdays,
-                                          PUBLISH_BIRTHDAYS_TIME)
+        await subscriptions_controller.new_task(channel, time, timezone)
+
+    @commands.slash_command()
+    async def reminders(self,
+                        inter: disnake.ApplicationCommandInteraction,
+                        days: str = commands.Param(default="")
+                        ):
+        """Adds reminders of upcoming birthdays to the daily message, e.g. days "7,1" for a week and a day ahead."""
+        """
+        Calling the command without days removes the reminders of the channel.
+
+        Args:
+            inter: disnake.ApplicationCommandInteraction object
+            days: numbers of days ahead of the birthdays separated by commas
+        """
+        if not subscriptions_controller.is_scheduled(inter.channel.id):
+            await inter.send(f"Not subscribed yet.")
+            return
+
+        reminder_days = _parse_reminder_days(days)
+        if reminder_days is None:
+            await inter.send(f"The days have to be numbers from 1 to {MAX_REMINDER_DAYS} separated by commas.")
+            return
+
+        await subscriptions_controller.set_reminder_days(inter.channel, reminder_days)
+        if reminder_days:
+            await inter.send(f"Reminders set: {', '.join(map(str, reminder_days))} days ahead.")
+        else:
+            await inter.send(f"Reminders removed.")
 
     @commands.slash_command()
     async def unsubscribe(self, inter: disnake.ApplicationCommandInteraction):
@@ -47,26 +106,142 @@ class SubscriptionCommands(commands.Cog):
         """
         # Only try to remove subscription if channel is already subscribed
         if subscriptions_controller.is_scheduled(inter.channel.id):
-            subscriptions_controller.remove_task(inter.channel)
+            await subscriptions_controller.remove_task(inter.channel)
             await inter.send(f"Successfully unsubscribed.")
         else:
             await inter.send(f"Not subscribed yet.")
 
-    @subscriptions_controller.run_daily_at(time=PUBLISH_BIRTHDAYS_TIME)
     @staticmethod
-    async def publish_daily_birthdays(guild_channel: GuildChannel):
+    async def publish_daily_birthdays(due_channels: list[tuple[GuildChannel, Date]],
+                                      on_delivered=None) -> fanout.FanOutReport:
         """
-        Fetches todays birthdays and publishes it to the given interaction.
+        Fetches todays birthdays and publishes them to the given channels.
         
-        On subscription a task is created and scheduled to execute this coroutine with the correct interaction
-        (e.g. to send the message to the channel, that the subscribe command was called in).
+        The daily dispatcher started in the 'on_ready' handler executes this coroutine with all channels whose
+        publish time is reached (e.g. to send the message to the channel, that the subscribe command was called in).
+        "Today" is passed along with every channel, since it depends on the timezone of the subscription.
+        Channels with reminders get the upcoming birthdays of their reminder days in the same message,
+        which is split into several parts if it exceeds Discord's length limit.
+        The tables are rendered once per guild and day for all reminder days of the guild's channels
+        and shared by all of them (counted by `metrics.shared_renders`),
+        and the messages are sent with a limited number of concurrent sends and a rate limit.
 
         Args:
-            guild_channel: disnake.abc.GuildChannel
+            due_channels: list of `(disnake.abc.GuildChannel, today)` tuples
+            on_delivered: optional coroutine function awaited with batches of ids of the channels
+                          the message was sent to, while the messages are sent
+
+        Returns:
+            `FanOutReport` with throughput and latency of the sent messages.
         """
-        birthdays = await bc.BirthdayCalendar(guild_channel.guild.id).get_todays_birthdays()
-        output = bc.make_output_table(birthdays)
-        await guild_channel.send(f"Heutige Geburtstage:\n```\n{output}\n```")
+        # Reminder days of the due channels per guild and day
+        reminder_days: dict[tuple[int, Date], dict[int, tuple[int, ...]]] = {}
+        for channel, today in due_channels:
+            days_by_channel = reminder_days.setdefault((channel.guild.id, today), {})
+            days_by_channel[channel.id] = subscriptions_controller.get_reminder_days(channel.id)
+
+        messages = {}
+        for (guild_id, today), days_by_channel in reminder_days.items():
+            calendar = bc.BirthdayCalendar(guild_id)
+            todays_table = await calendar.render_todays_birthdays(today)
+            reminder_tables = await calendar.render_reminders(
+                tuple(sorted({days for days_ahead in days_by_channel.values() for days in days_ahead})), today)
+            for days_ahead in set(days_by_channel.values()):
+                messages[guild_id, today, days_ahead] = _daily_message(todays_table, reminder_tables, days_ahead)
+
+        # Every channel beyond the first of its guild and day got the tables without rendering them again
+        avoided = len(due_channels) - len(reminder_days)
+        metrics.shared_renders.inc(avoided)
+
+        report = await fanout.fan_out([
+            (channel, messages[channel.guild.id, today, reminder_days[channel.guild.id, today][channel.id]])
+            for channel, today in due_channels
+        ], on_delivered=on_delivered)
+
+        print("----------------------")
+        print("Published daily birthdays:\n")
+        print(report.format())
+        print(f"Guilds rendered: {len(reminder_days)}, channels sharing their guild's tables: {avoided}")
+        print(f"Rendered tables cache: {bc.rendered_tables.info()}")
+        print("----------------------")
+
+        return report
+
+
+def _daily_message(todays_table: str, reminder_tables: dict[int, str],
+                   reminder_days: tuple[int, ...]) -> list[str]:
+    """
+    Combines the table of todays birthdays and the non-empty tables of the channel's reminder days.
+
+    Returns:
+        The message split into parts within Discord's length limit, to be sent in this order.
+    """
+    sections = [("Heutige Geburtstage", todays_table)]
+    for days in reminder_days:
+        if reminder_tables[days]:
+            heading = "Geburtstage morgen" if days == 1 else f"Geburtstage in {days} Tagen"
+            sections.append((heading, reminder_tables[days]))
+    return _split_message(sections)
+
+
+def _split_message(sections: list[tuple[str, str]], limit: int = MESSAGE_LENGTH_LIMIT) -> list[str]:
+    """
+    Formats every table as code block below its heading and packs the blocks into as few messages as possible.
+
+    A table too long for one message is split between its lines into several code blocks.
+
+    Args:
+        sections: list of `(heading, table)` tuples
+        limit (default: MESSAGE_LENGTH_LIMIT from config.py): maximum number of characters per message
+
+    Returns:
+        List of messages with at most `limit` characters each.
+    """
+    blocks = []
+    for heading, table in sections:
+        title = f"{heading}:"
+        lines = []
+        length = 0
+        for line in table.split("\n"):
+            # Title, code fences and line breaks around the lines take `len(title) + 8` characters
+            if lines and len(title) + 8 + length + len(line) + 1 > limit:
+                blocks.append(_code_block(title, lines))
+                title = f"{heading} (Fortsetzung):"
+                lines = []
+                length = 0
+            lines.append(line)
+            length += len(line) + 1
+        blocks.append(_code_block(title, lines))
+
+    messages = []
+    for block in blocks:
+        if messages and len(messages[-1]) + 1 + len(block) <= limit:
+            messages[-1] += "\n" + block
+        else:
+            messages.append(block)
+    return messages
+
+
+def _code_block(title: str, lines: list[str]) -> str:
+    return title + "\n```\n" + "\n".join(lines) + "\n```"
+
+
+def _parse_reminder_days(value: str) -> tuple[int, ...] | None:
+    """
+    Parses numbers of days separated by commas like `"7,1"`.
+
+    Returns:
+        The distinct numbers in ascending order (empty for an empty string) or `None` if a number is invalid.
+    """
+    parts = [part.strip() for part in value.split(",") if part.strip()]
+    if not all(part.isdigit() and 1 <= int(part) <= MAX_REMINDER_DAYS for part in parts):
+        return None
+    return tuple(sorted({int(part) for part in parts}))
+
+
+@functools.cache
+def _timezone_names() -> list[str]:
+    return sorted(zoneinfo.available_timezones())
 
 
 def setup(bot: commands.Bot):
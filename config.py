@@ -1,5 +1,28 @@
 DATES_FILEPATH = './data/dates.csv'
 SUBSCRIPTIONS_FILEPATH = './data/subscriptions.csv'
+DATES_JOURNAL_FILEPATH = './data/dates.journal.csv' # changes to DATES_FILEPATH not yet merged into it
+JOURNAL_COMPACTION_SIZE = 1024 * 1024 # merge the journal into DATES_FILEPATH as soon as it is larger (bytes)
+JOURNAL_COMPACTION_INTERVAL = 60 * 60 # merge the journal into DATES_FILEPATH at least every hour (seconds)
+DATABASE_FILEPATH = './data/birthdays.db'
+STORAGE_BACKEND = 'csv' # 'csv' to use the files above or 'sqlite' to use the database at DATABASE_FILEPATH
+STORAGE_EXECUTOR_WORKERS = 4 # number of threads running blocking storage calls off the event loop
+STORAGE_CHANGE_CHECK_INTERVAL = 30 # check every 30 seconds if another process changed the stored birthdays (seconds)
+CHANGE_LOG_RETENTION = 24 * 60 * 60 # keep the changes to the birthdays in the SQLite database for a day (seconds)
+METRICS_HOST = '127.0.0.1' # address the Prometheus metrics endpoint listens on
+METRICS_PORT = 9101 # port of the metrics endpoint at /metrics, 0 disables it
+METRICS_LOG_INTERVAL = 15 * 60 # print all metrics every 15 minutes (seconds), 0 disables it
 DATE_FORMAT = '%d.%m.%Y'
-PUBLISH_BIRTHDAYS_TIME = "08:00"
+MESSAGE_LENGTH_LIMIT = 2000 # maximum number of characters Discord accepts per message
+NAME_MAX_LENGTH = 100 # longest name that can be stored, Discord rejects longer autocomplete choices
+BIRTHDAYS_PAGE_SIZE = 10 # birthdays per page of `/birthdays`, keeps the message below Discord's limit of 2000 characters
+RENDER_CACHE_SIZE = 256 # maximum number of rendered birthday tables kept in memory
+PUBLISH_BIRTHDAYS_TIME = "08:00" # default time of day for new subscriptions (in the timezone of the subscription)
+DEFAULT_TIMEZONE = "Europe/Berlin" # IANA timezone for subscriptions without own timezone and for "today" in commands
+CHANNEL_FETCH_CONCURRENCY = 10 # maximum number of subscribed channels fetched at the same time on start-up
+PUBLISH_WORKERS = 8 # maximum number of daily birthday messages sent at the same time
+MAX_REMINDER_DAYS = 30 # furthest a reminder of an upcoming birthday can be set ahead (days)
+PUBLISH_RATE_LIMIT = 25 # maximum number of daily birthday messages sent per second (Discord allows 50 requests/s)
+PUBLISH_SAVE_INTERVAL = 30 # save the publish date of the delivered channels every 30 seconds while a publish runs (seconds)
+SHARD_COUNT = 0 # number of gateway shards of the whole deployment, 0 runs one unsharded bot (env SHARD_COUNT overrides)
+SHARD_IDS = '' # shards run by this process like '0-3' or '0,2', empty runs all of them (env SHARD_IDS overrides)
 LINK = 'https://discord.com/api/oauth2/authorize?client_id=952656778007552090&permissions=8&scope=bot' #put bot invite link here
\ No newline at end of file
@@ -1,8 +1,13 @@
-import pandas as pd
-from datetime import datetime
+from datetime import date as Date
+from enum import Enum
+from typing import Iterable
 from table2ascii import table2ascii as t2a, PresetStyle
-from config import DATES_FILEPATH
+from config import BIRTHDAYS_PAGE_SIZE, NAME_MAX_LENGTH, RENDER_CACHE_SIZE
+from daos.birthday_store import birthday_store
+from daos.storage import run_blocking
 from utils import datetime_tools
+from utils.lru_cache import LRUCache
+from utils.metrics import registry
 
 
 class BirthdayNotFoundError(Exception):
@@ -17,25 +22,39 @@ class WriteDaysLeftError(Exception):
     pass
 
 
+class EntryStatus(Enum):
+    """Result of `BirthdayCalendar.lookup_or_add`."""
+    FOUND = "found"
+    ADDED = "added"
+    NOT_FOUND = "not found"
+
+
 class Birthday:
-    def __init__(self, name: str, date: datetime, guild_id: int):
+    # No per-instance `__dict__`, guilds with many entries create a lot of these objects
+    __slots__ = ("name", "_date", "guild_id", "_days_left")
+
+    def __init__(self, name: str, date: Date, guild_id: int, days_left: int | None = None):
         self.name = name
         self._date = date
         self.guild_id = guild_id
+        self._days_left = days_left
 
     @property
-    def date(self) -> datetime:
-        "The date of the birthday stored as string in format "
+    def date(self) -> Date:
+        "The date of the birthday, formatted as string only for the output"
         return self._date
 
     @date.setter
     def date(self, date: str) -> None:
-        datetime_tools.format_date_string(date)
+        self._date = datetime_tools.string_to_date(date)
+        self._days_left = None
 
     @property
     def days_left(self) -> int:
         """Number of days until the birthdays."""
-        return datetime_tools.days_until_yearday(self._date)
+        if self._days_left is None:
+            self._days_left = datetime_tools.days_until_yearday(self._date)
+        return self._days_left
 
     @days_left.setter
     def days_left(self, _value) -> WriteDaysLeftError:
@@ -45,65 +64,206 @@ class Birthday:
         return self.days_left == 0
 
 
+# Rendered output tables keyed by `(kind, guild_id, store version of the guild, day)`
+rendered_tables = LRUCache(RENDER_CACHE_SIZE)
+
+registry.collect("bot_render_cache_hits_total", "Rendered tables served from the cache.",
+                 lambda: rendered_tables.hits, "counter")
+registry.collect("bot_render_cache_misses_total", "Rendered tables that had to be rendered.",
+                 lambda: rendered_tables.misses, "counter")
+registry.collect("bot_render_cache_entries", "Rendered tables in the cache.", lambda: len(rendered_tables))
+
+
 class BirthdayCalendar:
-    def __init__(self, guild_id):
+    def __init__(self, guild_id, timezone: str | None = None):
+        """
+        Args:
+            guild_id: id of the guild the birthdays belong to
+            timezone (default: DEFAULT_TIMEZONE from config.py): IANA timezone "today" is determined in
+        """
         self.guild_id = guild_id
+        self.timezone = timezone
+
+    def today(self) -> Date:
+        """Todays date in the timezone of the calendar."""
+        return datetime_tools.current_date(self.timezone)
 
-    async def list_birthdays(self) -> list[Birthday]:
+    async def list_birthdays(self, today: Date | None = None) -> list[Birthday]:
         """
         Lists all birthday dates associated to the guild with id given to `BirthdayCalendar.guild_id` attribute.
 
+        Args:
+            today (default: today in the timezone of the calendar): the day to count the days left from
+
+        Returns:
+            List of `Birthday` objects sorted by days left and name.
+        """
+        birthdays = [
+            Birthday(name, date, self.guild_id, days_left)
+            for name, date, days_left in birthday_store.sorted_by_days_left(self.guild_id, today or self.today())
+        ]
+
+        return birthdays
+
+    async def get_todays_birthdays(self, today: Date | None = None) -> list[Birthday]:
+        """
+        Gets all entries that have birthday today and are associated to the guild with id given to
+        `BirthdayCalendar.guild_id` attribute.
+
+        Args:
+            today (default: today in the timezone of the calendar): the day to get the birthdays for
+
         Returns:
             List of `Birthday` objects.
         """
-        df = pd.read_csv(DATES_FILEPATH)
+        birthdays = [
+            Birthday(name, date, self.guild_id, days_left=0)
+            for name, date in birthday_store.on_day(self.guild_id, today or self.today())
+        ]
+
+        return birthdays
+
+    async def get_birthdays_page(self, page: int, page_size: int, today: Date | None = None) -> list[Birthday]:
+        """
+        Lists one page of the birthday dates associated to the guild, ordered like `list_birthdays`.
 
-        # Filter for the entries associated to the guild_id
-        df = df[df["guild_id"] == self.guild_id]
+        Only the entries of the requested page are read from the store.
 
-        df["days_left"] = df["date"].apply(datetime_tools.days_until_yearday)
-        df = df.sort_values(by=["days_left", "name"]).reset_index(drop=True)
+        Args:
+            page: number of the page, starting with 1
+            page_size: number of birthdays per page
+            today (default: today in the timezone of the calendar): the day to count the days left from
 
+        Returns:
+            List of at most `page_size` `Birthday` objects.
+        """
         birthdays = [
-            Birthday(row["name"], row["date"], self.guild_id)
-            for _, row in df.iterrows()
+            Birthday(name, date, self.guild_id, days_left)
+            for name, date, days_left in birthday_store.upcoming(
+                self.guild_id, page_size, today or self.today(), offset=(page - 1) * page_size)
         ]
 
         return birthdays
 
-    async def get_todays_birthdays(self) -> list[Birthday]:
+    async def page_count(self, page_size: int) -> int:
+        """Number of pages needed to list all birthdays of the guild (at least one)."""
+        return max(1, -(-birthday_store.count(self.guild_id) // page_size))
+
+    async def render_birthdays_page(self, page: int, page_size: int = BIRTHDAYS_PAGE_SIZE) -> str:
         """
-        Gets all entries that have birthday today and are associated to the guild with id given to
-        `BirthdayCalendar.guild_id` attribute.
+        Renders the output table of one page of the birthdays associated to the guild.
+
+        The page is rendered only once per day and version of the guild's entries, afterwards it is served
+        from `rendered_tables`.
+
+        Args:
+            page: number of the page, starting with 1
+            page_size (default: BIRTHDAYS_PAGE_SIZE from config.py): number of birthdays per page
 
         Returns:
-            List of `Birthday` objects.
+            output string as returned by `make_output_table`.
         """
-        dates = await self.list_birthdays()
+        today = self.today()
+        key = ("page", self.guild_id, birthday_store.version(self.guild_id), today, page_size, page)
 
-        # Filter for entries that have birthday today
-        birthdays = list(filter(lambda birthday: birthday.is_today(), dates))
+        output = rendered_tables.get(key)
+        if output is None:
+            output = make_output_table(await self.get_birthdays_page(page, page_size, today))
+            rendered_tables.put(key, output)
+
+        return output
+
+    async def render_todays_birthdays(self, today: Date | None = None) -> str:
+        """
+        Renders the output table of todays birthdays associated to the guild.
+
+        The table is rendered only once per day and version of the guild's entries, afterwards it is served
+        from `rendered_tables`.
+
+        Args:
+            today (default: today in the timezone of the calendar): the day to render the birthdays of
+
+        Returns:
+            output string as returned by `make_output_table`.
+        """
+        today = today or self.today()
+        key = ("today", self.guild_id, birthday_store.version(self.guild_id), today)
+
+        output = rendered_tables.get(key)
+        if output is None:
+            output = make_output_table(await self.get_todays_birthdays(today))
+            rendered_tables.put(key, output)
+
+        return output
+
+    async def render_reminders(self, days_ahead: tuple[int, ...], today: Date | None = None) -> dict[int, str]:
+        """
+        Renders the output tables of the birthdays associated to the guild in each of the given numbers of days.
+
+        Like `render_todays_birthdays` every table is cached, the tables missing in `rendered_tables` are
+        computed with a single lookup in the store.
+
+        Args:
+            days_ahead: numbers of days from today
+            today (default: today in the timezone of the calendar): the day to count from
+
+        Returns:
+            Dictionary mapping every number of days to the output string as returned by `make_output_table`,
+            or an empty string if there are no birthdays on that day.
+        """
+        today = today or self.today()
+        version = birthday_store.version(self.guild_id)
+
+        tables = {}
+        for days in days_ahead:
+            output = rendered_tables.get(("reminder", self.guild_id, version, today, days))
+            if output is not None:
+                tables[days] = output
+
+        missing = [days for days in days_ahead if days not in tables]
+        for days, entries in birthday_store.in_days(self.guild_id, missing, today).items():
+            birthdays = [Birthday(name, date, self.guild_id, days) for name, date in entries]
+            tables[days] = make_output_table(birthdays) if birthdays else ""
+            rendered_tables.put(("reminder", self.guild_id, version, today, days), tables[days])
+
+        return tables
+
+    async def get_upcoming_birthdays(self, count: int) -> list[Birthday]:
+        """
+        Gets the next `count` birthdays (starting with todays birthdays) associated to the guild with id given to
+        `BirthdayCalendar.guild_id` attribute.
+
+        Args:
+            count: maximum number of birthdays to return
+
+        Returns:
+            List of `Birthday` objects sorted by days left and name.
+        """
+        birthdays = [
+            Birthday(name, date, self.guild_id, days_left)
+            for name, date, days_left in birthday_store.upcoming(self.guild_id, count, self.today())
+        ]
 
         return birthdays
 
     async def get_birthday(self, name: str) -> Birthday:
         """
-        Builds a markdown table as code-block from given dataframe and name.
+        Gets the birthday stored for the given name.
 
         Args:
-            name: the name to filter the df for to create the output
+            name: the name of the person as string
+
+        Raises:
+            BirthdayNotFoundError: if no entry exists for the given name.
 
         Returns:
             One `Birthday` object.
         """
-        df = await self._get_all_birthdays_as_df()
-
-        # Suche den Eintrag für den gegebenen Namen
-        df = df.iloc[df[df["name"] == name].index[0]]
-
-        birthday = Birthday(df["name"], df["date"], self.guild_id)
+        date = birthday_store.get(self.guild_id, name)
+        if date is None:
+            raise BirthdayNotFoundError(name)
 
-        return birthday
+        return self._birthday(name, date)
 
     async def exists_entry(self, name: str) -> bool:
         """
@@ -115,12 +275,51 @@ class BirthdayCalendar:
         Returns:
             `True` if an entry exists, `False` else.
         """
-        list_of_birthdays = await self.list_birthdays()
-        list_of_name_checks = [
-            birthday.name == name for birthday in list_of_birthdays
-        ]
+        return birthday_store.contains(self.guild_id, name)
+
+    async def find_names(self, prefix: str, limit: int = 25) -> list[str]:
+        """
+        Looks up the names starting with the given prefix (ignoring case).
 
-        return any(list_of_name_checks)
+        Names longer than `NAME_MAX_LENGTH` (stored before the limit existed) are left out,
+        since Discord rejects the whole list of autocomplete choices if one is too long.
+
+        Args:
+            prefix: beginning of the names to look for
+            limit (default: 25, the maximum number of autocomplete choices): maximum number of names
+
+        Returns:
+            List of names in alphabetical order.
+        """
+        return birthday_store.names_with_prefix(self.guild_id, prefix, limit, max_length=NAME_MAX_LENGTH)
+
+    async def lookup_or_add(self, name: str, date: str | None = None) -> tuple[EntryStatus, Birthday | None]:
+        """
+        Looks up the entry with the given name and adds it with the given date if it does not exist.
+
+        Lookup and insert are one keyed operation on the store, an existing entry is never overwritten.
+
+        Args:
+            name: the name of the person as string
+            date (default: None): the birthday date as a string; without date nothing is added
+
+        Returns:
+            `(EntryStatus.FOUND, existing birthday)`, `(EntryStatus.ADDED, added birthday)`
+            or `(EntryStatus.NOT_FOUND, None)` if no entry exists and no date was given.
+        """
+        if not date:
+            existing = birthday_store.get(self.guild_id, name)
+            if existing is None:
+                return EntryStatus.NOT_FOUND, None
+            return EntryStatus.FOUND, self._birthday(name, existing)
+
+        parsed = datetime_tools.string_to_date(date)
+        existing = await birthday_store.add_if_absent(self.guild_id, name, parsed)
+        if existing is not None:
+            return EntryStatus.FOUND, self._birthday(name, existing)
+
+        self._invalidate_rendered_tables()
+        return EntryStatus.ADDED, self._birthday(name, parsed)
 
     async def add_entry(self, name: str, date: str) -> Birthday:
         """
@@ -133,57 +332,66 @@ class BirthdayCalendar:
         Returns:
             The added birthday `Birthday` object.
         """
-        birthday = Birthday(name, date, self.guild_id)
+        date = datetime_tools.string_to_date(date)
+        await birthday_store.add(self.guild_id, name, date)
+        self._invalidate_rendered_tables()
 
-        df_new = pd.DataFrame({
-            "name": [name],
-            "date": [datetime_tools.format_date_string(date)],
-            "guild_id": self.guild_id
-        })
-        df = pd.concat(
-            [await self._get_all_birthdays_as_df(filter_by_guild_id=False), df_new
-             ],  # No filtering to not override the file with missing entries.
-            ignore_index=True,
-        )
+        return self._birthday(name, date)
 
-        df.to_csv(DATES_FILEPATH, index=False)
+    async def import_entries(self, entries: Iterable[tuple[str, str]]) -> tuple[int, int, int]:
+        """
+        Adds the given entries to the repository with a single write, existing entries are kept.
 
-        return birthday
+        The entries are read and parsed in the storage thread pool, so a large upload does not block the event loop.
 
+        Args:
+            entries: iterable of `(name, date)` tuples with the date as string, e.g. as read from an uploaded file
 
-    async def remove_entry(self, name: str) -> None:
+        Returns:
+            `(added, skipped, invalid)`: number of added entries, of entries skipped because the name is
+            stored already (or appears more than once) and of entries without name, with a name longer than
+            `NAME_MAX_LENGTH` or with an invalid date.
         """
-        Removes an entry with given name from the repository.
+        valid, invalid = await run_blocking(_parse_entries, entries)
 
-        Args:
-            name: the name of the person as string
-        """
-        df = await self._get_all_birthdays_as_df()
-        df = df.drop(df[(df["name"] == name)].index)
+        added = await birthday_store.add_many(self.guild_id, valid)
+        if added:
+            self._invalidate_rendered_tables()
 
-        df.to_csv(DATES_FILEPATH, index=False)
+        return added, len(valid) - added, invalid
 
+    async def export_entries(self) -> list[tuple[str, Date]]:
+        """
+        Lists all entries of the guild in calendar order, e.g. to write them to a file.
 
-    async def _get_all_birthdays_as_df(self, filter_by_guild_id=True) -> pd.DataFrame:
-        """Gets all birthday dates.
+        Returns:
+            List of `(name, date)` tuples.
+        """
+        return birthday_store.entries(self.guild_id)
+
+    async def remove_entry(self, name: str) -> bool:
+        """
+        Removes an entry with given name from the repository if it exists.
 
         Args:
-            filter_by_guild_id (default: `True`): Query for all guilds if `filter_by_guild_id = False`
-                                                  or for the guild_id of this calendar (default)
+            name: the name of the person as string
 
         Returns:
-            All birthdays as pandas DataFrame with columns `name`, `date`, `guild_id`.
+            `True` if the entry was removed, `False` if no entry with the given name exists.
         """
-        df = pd.read_csv(DATES_FILEPATH)
+        removed = await birthday_store.remove(self.guild_id, name)
+        if removed:
+            self._invalidate_rendered_tables()
 
-        if filter_by_guild_id:
-            # Filter for the entries associated to the guild_id
-            df = df[df["guild_id"] == self.guild_id]
+        return removed
 
-        df["days_left"] = df["date"].apply(datetime_tools.days_until_yearday)
-        df = df.sort_values(by=["days_left", "name"]).reset_index(drop=True)
-        
-        return df
+    def _birthday(self, name: str, date: Date) -> Birthday:
+        """Creates the `Birthday` object for an entry, counting the days left from today in the calendar's timezone."""
+        return Birthday(name, date, self.guild_id, datetime_tools.days_until_yearday(date, self.today()))
+
+    def _invalidate_rendered_tables(self) -> None:
+        """Drops the cached output tables of the guild, they are outdated after a change."""
+        rendered_tables.invalidate(lambda key: key[1] == self.guild_id)
 
 
 #################################################
@@ -201,7 +409,7 @@ def make_output_table(list_of_birthdays: list[Birthday]) -> str:
     Returns:
         output string with markdown table containing name, date and days_left or "Herzlichen Glückwunsch" if days_left is equal to zero.
     """
-    body = [[bd.name, bd.date,
+    body = [[bd.name, datetime_tools.date_to_string(bd.date),
              _gratulation_if_zero_days_left(bd.days_left)]
             for bd in list_of_birthdays]
 
@@ -226,7 +434,7 @@ def make_output_table_for_birthday(birthday: Birthday) -> str:
     # Erstelle Tabelle
     output = t2a(header=["Name", "Datum", "Verbleibende Tage"],
                  body=[[
-                     birthday.name, birthday.date,
+                     birthday.name, datetime_tools.date_to_string(birthday.date),
                      _gratulation_if_zero_days_left(birthday.days_left)
                  ]],
                  style=PresetStyle.thin_compact)
@@ -234,6 +442,26 @@ def make_output_table_for_birthday(birthday: Birthday) -> str:
     return output
 
 
+def _parse_entries(entries: Iterable[tuple[str, str]]) -> tuple[list[tuple[str, Date]], int]:
+    """
+    Parses the dates of the entries to import.
+
+    Returns:
+        `(valid, invalid)`: list of `(name, date)` tuples of the valid entries and number of invalid entries.
+    """
+    valid = []
+    invalid = 0
+    for name, date in entries:
+        if not name or len(name) > NAME_MAX_LENGTH:
+            invalid += 1
+            continue
+        try:
+            valid.append((name, datetime_tools.string_to_date(date)))
+        except ValueError:
+            invalid += 1
+    return valid, invalid
+
+
 def _gratulation_if_zero_days_left(days_left):
     if days_left == 0:
         return "Herzlichen Glückwunsch!"
@@ -0,0 +1,410 @@
+import asyncio
+import bisect
+import itertools
+import traceback
+from datetime import date as Date, timedelta
+from typing import Iterable
+
+from config import STORAGE_CHANGE_CHECK_INTERVAL
+from daos.storage import get_storage, run_blocking
+from utils import datetime_tools
+from utils.metrics import store_load_duration
+
+
+# Days whose birthdays fall on the same day in years without 29 February
+_END_OF_FEBRUARY = ((2, 28), (2, 29))
+
+
+class BirthdayStore:
+    """
+    Process-wide in-memory index of all stored birthdays.
+
+    The birthdays are read once from the storage backend and afterwards all reads are answered from memory.
+    Per guild three indexes are kept:
+        - `name -> date` for keyed lookups (dates are parsed once on load and kept as `datetime.date`)
+        - a list of `(month, day, name)` tuples sorted by day of year for ordered listings
+        - `(month, day) -> names` buckets to look up the birthdays of a single day
+        - a list of `(casefolded name, name)` tuples sorted by name to look up names by prefix
+    Writes are passed on to the storage backend in the storage thread pool and update the indexes only once
+    they are persisted, so a failed write leaves the indexes as they were.
+    Every change of a guild gives it a new version number, so results derived from the entries of
+    a guild can be cached as long as its version stays the same.
+    With a `guild_filter` only the entries of the guilds it accepts are loaded, e.g. the guilds of the shards
+    a process runs.
+    Changes by other processes sharing the storage are picked up by `watch_storage`.
+    """
+    def __init__(self, storage=None, guild_filter=None):
+        self._storage = storage
+        self.guild_filter = guild_filter
+        # Keeps the writes to the storage backend in the same order as the changes to the indexes
+        self._write_lock = asyncio.Lock()
+        self._dates_by_guild: dict[int, dict[str, Date]] = {}
+        self._yearday_index: dict[int, list[tuple[int, int, str]]] = {}
+        self._day_buckets: dict[int, dict[tuple[int, int], list[str]]] = {}
+        self._name_index: dict[int, list[tuple[str, str]]] = {}
+        self._version_counter = itertools.count()
+        self._base_version = next(self._version_counter)
+        self._versions: dict[int, int] = {}
+        self._loaded = False
+
+    def load(self) -> None:
+        """(Re-)reads all birthdays from the storage backend and rebuilds all indexes."""
+        with store_load_duration.time():
+            self._apply(self._read())
+
+    async def reload(self) -> None:
+        """
+        Re-reads all birthdays in the storage thread pool and replaces the indexes once they are rebuilt.
+
+        Reads are answered from the previous indexes meanwhile, writes wait for the reload.
+        """
+        async with self._write_lock:
+            with store_load_duration.time():
+                self._apply(await run_blocking(self._read))
+
+    async def watch_storage(self, interval: int = STORAGE_CHANGE_CHECK_INTERVAL):
+        """
+        Loop to check every `interval` seconds if another process changed the stored birthdays and apply the changes.
+
+        Only the changed rows are read from the storage backend and only those of the guilds accepted by
+        the `guild_filter` are applied, so the versions of all other guilds stay the same.
+        All birthdays are only read again if the backend cannot tell the changed rows any more.
+        A failed check is logged and retried after the next interval.
+        This is executed as task in the handler for the 'on_ready' bot event.
+
+        Args:
+            interval (default: STORAGE_CHANGE_CHECK_INTERVAL from config.py): number of seconds between two checks
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Holding the write lock, so no own write to the same birthday happens between reading and applying
+                async with self._write_lock:
+                    changes = await run_blocking(self.storage.birthday_changes)
+                    if changes:
+                        self._apply_changes(changes)
+                if changes is None:
+                    print("Changes of the stored birthdays are unknown, reloading all of them.")
+                    await self.reload()
+            except Exception:
+                traceback.print_exc()
+
+    @property
+    def storage(self):
+        """The storage backend, defaults to the one selected in config.py."""
+        if self._storage is None:
+            self._storage = get_storage()
+        return self._storage
+
+    def get(self, guild_id: int, name: str) -> Date | None:
+        """
+        Looks up the date stored for the given name.
+
+        Returns:
+            The date or `None` if no entry exists.
+        """
+        self._ensure_loaded()
+        return self._dates_by_guild.get(guild_id, {}).get(name)
+
+    def contains(self, guild_id: int, name: str) -> bool:
+        self._ensure_loaded()
+        return name in self._dates_by_guild.get(guild_id, {})
+
+    def names_with_prefix(self, guild_id: int, prefix: str, limit: int = 25,
+                          max_length: int | None = None) -> list[str]:
+        """
+        Lists the names of the guild starting with the given prefix (ignoring case) in alphabetical order.
+
+        Args:
+            prefix: beginning of the names to look for
+            limit: maximum number of names to return
+            max_length: names longer than this are skipped
+
+        Returns:
+            List of at most `limit` names.
+        """
+        self._ensure_loaded()
+        index = self._name_index.get(guild_id, [])
+        prefix = prefix.casefold()
+
+        names = []
+        pos = bisect.bisect_left(index, (prefix,))
+        while pos < len(index) and len(names) < limit and index[pos][0].startswith(prefix):
+            if max_length is None or len(index[pos][1]) <= max_length:
+                names.append(index[pos][1])
+            pos += 1
+
+        return names
+
+    def version(self, guild_id: int) -> int:
+        """Version number of the entries of the guild, it changes whenever an entry is added or removed."""
+        self._ensure_loaded()
+        return self._versions.get(guild_id, self._base_version)
+
+    def count(self, guild_id: int) -> int:
+        self._ensure_loaded()
+        return len(self._dates_by_guild.get(guild_id, {}))
+
+    def entries(self, guild_id: int) -> list[tuple[str, Date]]:
+        """
+        Lists all entries of the guild in calendar order (by month, day and name).
+
+        Returns:
+            List of `(name, date)` tuples.
+        """
+        self._ensure_loaded()
+        dates = self._dates_by_guild.get(guild_id, {})
+        return [(name, dates[name]) for _, _, name in self._yearday_index.get(guild_id, [])]
+
+    def sorted_by_days_left(self, guild_id: int, today: Date | None = None) -> list[tuple[str, Date, int]]:
+        """
+        Lists all entries of the guild ordered by days left until the birthday and name.
+
+        Returns:
+            List of `(name, date, days_left)` tuples.
+        """
+        return self.upcoming(guild_id, self.count(guild_id), today)
+
+    def upcoming(self, guild_id: int, count: int, today: Date | None = None,
+                 offset: int = 0) -> list[tuple[str, Date, int]]:
+        """
+        Lists the next `count` entries of the guild starting with the birthdays of today.
+
+        With `offset` the first `offset` entries are skipped, e.g. to list one page of the entries.
+
+        The yearday index is sorted by `(month, day, name)`, so the entries are collected by walking
+        the index from todays position (wrapping around at the end of the year) instead of sorting.
+        The days left are calculated for all collected entries at once from their month and day.
+        Only the birthdays on 28 and 29 February share their days left in years without 29 February,
+        so the collected entries are widened to both complete days and sorted by name if they do.
+
+        Returns:
+            List of `(name, date, days_left)` tuples ordered by days left and name.
+        """
+        self._ensure_loaded()
+        today = today or datetime_tools.current_date()
+        index = self._yearday_index.get(guild_id, [])
+        dates = self._dates_by_guild.get(guild_id, {})
+        count = max(0, min(count, len(index) - offset))
+        pos = bisect.bisect_left(index, (today.month, today.day))
+
+        def entry(i):
+            return index[(pos + i) % len(index)]
+
+        start, end = offset, offset + count
+        if count:
+            while start > 0 and entry(start - 1)[:2] in _END_OF_FEBRUARY and entry(start)[:2] in _END_OF_FEBRUARY:
+                start -= 1
+            while end < len(index) and entry(end)[:2] in _END_OF_FEBRUARY and entry(end - 1)[:2] in _END_OF_FEBRUARY:
+                end += 1
+
+        entries = [entry(i) for i in range(start, end)]
+        days_left = datetime_tools.days_until_yeardays([month for month, _, _ in entries],
+                                                       [day for _, day, _ in entries],
+                                                       today)
+        result = [(name, dates[name], days) for (_, _, name), days in zip(entries, days_left)]
+        if any(a[2] == b[2] and a[1] != b[1] for a, b in zip(result, result[1:])):
+            result.sort(key=lambda item: (item[2], item[0]))
+
+        return result[offset - start:offset - start + count]
+
+    def on_day(self, guild_id: int, today: Date | None = None) -> list[tuple[str, Date]]:
+        """
+        Lists all entries of the guild that are celebrated on the given day (defaults to today).
+
+        Entries born on 29 February are celebrated on 28 February in non-leap years.
+
+        Returns:
+            List of `(name, date)` tuples.
+        """
+        return self.in_days(guild_id, [0], today)[0]
+
+    def in_days(self, guild_id: int, days_ahead: Iterable[int],
+                today: Date | None = None) -> dict[int, list[tuple[str, Date]]]:
+        """
+        Lists the entries of the guild celebrated in each of the given numbers of days from today.
+
+        Every day is a single lookup in the `(month, day)` buckets, so any number of days is answered
+        without walking the entries of the guild.
+
+        Args:
+            days_ahead: numbers of days from today, 0 for the birthdays of today
+            today (default: today in DEFAULT_TIMEZONE from config.py): the day to count from
+
+        Returns:
+            Dictionary mapping every number of days to a list of `(name, date)` tuples.
+        """
+        self._ensure_loaded()
+        today = today or datetime_tools.current_date()
+        buckets = self._day_buckets.get(guild_id, {})
+        dates = self._dates_by_guild.get(guild_id, {})
+
+        return {days: [(name, dates[name])
+                       for key in datetime_tools.celebrated_yeardays(today + timedelta(days=days))
+                       for name in buckets.get(key, [])]
+                for days in days_ahead}
+
+    async def add(self, guild_id: int, name: str, date: Date) -> None:
+        """Adds or replaces the entry for the given name and persists the change."""
+        self._ensure_loaded()
+        async with self._write_lock:
+            await run_blocking(self.storage.add_birthday, guild_id, name,
+                               datetime_tools.date_to_string(date))
+            if name in self._dates_by_guild.get(guild_id, {}):
+                self._delete(guild_id, name)
+            self._insert(guild_id, name, date)
+
+    async def add_if_absent(self, guild_id: int, name: str, date: Date) -> Date | None:
+        """
+        Adds the entry for the given name and persists it, unless an entry for the name exists already.
+
+        Checking and adding happen in one step, so a concurrent write cannot slip in between.
+
+        Returns:
+            The date of the existing entry or `None` if the entry was added.
+        """
+        self._ensure_loaded()
+        async with self._write_lock:
+            existing = self._dates_by_guild.get(guild_id, {}).get(name)
+            if existing is not None:
+                return existing
+            await run_blocking(self.storage.add_birthday, guild_id, name,
+                               datetime_tools.date_to_string(date))
+            self._insert(guild_id, name, date)
+            return None
+
+    async def add_many(self, guild_id: int, entries: list[tuple[str, Date]]) -> int:
+        """
+        Adds all entries whose name has no entry yet and persists them with a single storage write.
+
+        Existing entries are kept; of several entries with the same name only the first one is added.
+
+        Args:
+            entries: list of `(name, date)` tuples
+
+        Returns:
+            Number of added entries.
+        """
+        self._ensure_loaded()
+        async with self._write_lock:
+            existing = self._dates_by_guild.get(guild_id, {})
+            new_entries = {}
+            for name, date in entries:
+                if name not in existing and name not in new_entries:
+                    new_entries[name] = date
+            if not new_entries:
+                return 0
+
+            await run_blocking(self.storage.add_birthdays,
+                               [(guild_id, name, datetime_tools.date_to_string(date))
+                                for name, date in new_entries.items()])
+            for name, date in new_entries.items():
+                self._insert(guild_id, name, date)
+            return len(new_entries)
+
+    async def remove(self, guild_id: int, name: str) -> bool:
+        """
+        Removes the entry for the given name (if it exists) and persists the change.
+
+        Returns:
+            `True` if an entry was removed, `False` if none existed.
+        """
+        self._ensure_loaded()
+        async with self._write_lock:
+            if name not in self._dates_by_guild.get(guild_id, {}):
+                return False
+            await run_blocking(self.storage.remove_birthday, guild_id, name)
+            self._delete(guild_id, name)
+            return True
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    def _read(self) -> tuple[dict, dict, dict, dict]:
+        """Reads all birthdays from the storage backend and builds new indexes without touching the current ones."""
+        dates_by_guild = {}
+        yearday_index = {}
+        day_buckets = {}
+        name_index = {}
+
+        for name, date, guild_id in self.storage.load_birthdays():
+            if self.guild_filter is None or self.guild_filter(guild_id):
+                try:
+                    parsed = datetime_tools.string_to_date(date)
+                except ValueError:
+                    # One damaged row must not keep the birthdays of all guilds from loading
+                    print(f"Skipping stored birthday of {name!r} in guild {guild_id} with invalid date {date!r}")
+                    continue
+                dates_by_guild.setdefault(guild_id, {})[name] = parsed
+
+        for guild_id, dates in dates_by_guild.items():
+            index = []
+            buckets = {}
+            for name, date in dates.items():
+                index.append((date.month, date.day, name))
+                buckets.setdefault((date.month, date.day), []).append(name)
+            index.sort()
+            for names in buckets.values():
+                names.sort()
+            yearday_index[guild_id] = index
+            day_buckets[guild_id] = buckets
+            name_index[guild_id] = sorted((name.casefold(), name) for name in dates)
+
+        return dates_by_guild, yearday_index, day_buckets, name_index
+
+    def _apply(self, indexes: tuple[dict, dict, dict, dict]) -> None:
+        # The counter only grows, so the new base version differs from all versions derived results were cached for
+        self._dates_by_guild, self._yearday_index, self._day_buckets, self._name_index = indexes
+        self._base_version = next(self._version_counter)
+        self._versions = {}
+        self._loaded = True
+
+    def _apply_changes(self, changes: list[tuple[int, str, str | None]]) -> None:
+        """Applies `(guild_id, name, date)` changes of other processes, `date` is `None` for a removed birthday."""
+        applied = 0
+        for guild_id, name, date in changes:
+            if self.guild_filter is not None and not self.guild_filter(guild_id):
+                continue
+            if date is not None:
+                try:
+                    parsed = datetime_tools.string_to_date(date)
+                except ValueError:
+                    print(f"Skipping stored birthday of {name!r} in guild {guild_id} with invalid date {date!r}")
+                    continue
+            known = name in self._dates_by_guild.get(guild_id, {})
+            if known:
+                self._delete(guild_id, name)
+            if date is not None:
+                self._insert(guild_id, name, parsed)
+            applied += known or date is not None
+        if applied:
+            print(f"Applied {applied} changes of the stored birthdays by another process.")
+
+    def _insert(self, guild_id: int, name: str, date: Date) -> None:
+        self._versions[guild_id] = next(self._version_counter)
+        key = (date.month, date.day)
+        self._dates_by_guild.setdefault(guild_id, {})[name] = date
+        bisect.insort(self._yearday_index.setdefault(guild_id, []), (*key, name))
+        bisect.insort(self._day_buckets.setdefault(guild_id, {}).setdefault(key, []), name)
+        bisect.insort(self._name_index.setdefault(guild_id, []), (name.casefold(), name))
+
+    def _delete(self, guild_id: int, name: str) -> None:
+        self._versions[guild_id] = next(self._version_counter)
+        date = self._dates_by_guild[guild_id].pop(name)
+        key = (date.month, date.day)
+        self._yearday_index[guild_id].remove((*key, name))
+        self._day_buckets[guild_id][key].remove(name)
+        self._name_index[guild_id].remove((name.casefold(), name))
+
+        if not self._day_buckets[guild_id][key]:
+            del self._day_buckets[guild_id][key]
+        if not self._dates_by_guild[guild_id]:
+            del self._dates_by_guild[guild_id]
+            del self._yearday_index[guild_id]
+            del self._day_buckets[guild_id]
+            del self._name_index[guild_id]
+
+
+# Shared instance used by all `BirthdayCalendar` objects of this process
+birthday_store = BirthdayStore()
@@ -0,0 +1,412 @@
+import asyncio
+import csv
+import io
+import os
+import threading
+import traceback
+from contextlib import contextmanager
+
+from config import (DATES_FILEPATH, DATES_JOURNAL_FILEPATH, JOURNAL_COMPACTION_INTERVAL,
+                    JOURNAL_COMPACTION_SIZE, SUBSCRIPTIONS_FILEPATH)
+from daos.storage import run_blocking
+from utils import datetime_tools
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, the files must not be shared by several processes there
+    fcntl = None
+
+_JOURNAL_ADD = "+"
+_JOURNAL_REMOVE = "-"
+
+_DATES_HEADER = ["name", "date", "guild_id"]
+_SUBSCRIPTIONS_HEADER = ["channel_id", "guild_id", "publish_time", "timezone", "last_published", "reminder_days"]
+
+
+class CsvStorage:
+    """
+    Storage backend keeping birthdays and subscriptions in the CSV files given in config.py.
+
+    The rows read on load are cached, so a write does not have to read the files again.
+    Changes to the birthdays are appended to a journal file instead of rewriting the dates file.
+    The journal is replayed on load and merged into the dates file (compacted) as soon as it grows larger
+    than `JOURNAL_COMPACTION_SIZE` or periodically by `run_periodic_compaction`.
+
+    The files can be shared by several processes (e.g. bot processes running different shards or admin scripts):
+    every access holds an advisory lock on a `.lock` file next to the data file, and whole files are rewritten
+    to a temporary file that is renamed to the data file, so readers never see a partly written file.
+    Before every write the cached rows are brought up to date if inode, modification time or size of the files
+    show that another process changed them: rows appended to the journal are replayed from the last read offset,
+    only after another process compacted the journal the files are read again.
+    The changes found this way are handed out by `birthday_changes`.
+    """
+    def __init__(self,
+                 dates_filepath: str = DATES_FILEPATH,
+                 subscriptions_filepath: str = SUBSCRIPTIONS_FILEPATH,
+                 journal_filepath: str = DATES_JOURNAL_FILEPATH,
+                 compaction_size: int = JOURNAL_COMPACTION_SIZE):
+        self.dates_filepath = dates_filepath
+        self.subscriptions_filepath = subscriptions_filepath
+        self.journal_filepath = journal_filepath
+        self.compaction_size = compaction_size
+        self._lock = threading.Lock()
+        self._birthdays: dict[tuple[int, str], str] | None = None
+        self._subscriptions: dict[int, tuple[int | None, str | None, str | None, str | None, str | None]] | None = None
+        # Number of bytes of the journal applied to the cached birthdays
+        self._journal_size = 0
+        # State of the files the cached rows correspond to, see `_signature`
+        self._birthdays_signature = None
+        self._subscriptions_signature = None
+        # Changes by other processes applied to the cached birthdays, until `birthday_changes` hands them out
+        self._foreign_changes: list[tuple[int, str, str | None]] = []
+
+    def load_birthdays(self) -> list[tuple[str, str, int]]:
+        """
+        Reads all birthdays of all guilds from the dates file and replays the journal on top of them.
+
+        Returns:
+            List of `(name, date, guild_id)` tuples.
+        """
+        with self._lock, _file_lock(self.dates_filepath):
+            self._read_birthdays()
+            self._foreign_changes = []
+            return [(name, date, guild_id) for (guild_id, name), date in self._birthdays.items()]
+
+    def birthday_changes(self) -> list[tuple[int, str, str | None]] | None:
+        """
+        Collects the changes other processes made to the birthdays since the last call or `load_birthdays`.
+
+        Only the file metadata is compared as long as nothing changed, so this is cheap enough to be called
+        periodically. Changes this storage made itself are not included.
+
+        Returns:
+            List of `(guild_id, name, date)` tuples, `date` is `None` for a removed birthday,
+            or `None` if the birthdays were not loaded yet.
+        """
+        with self._lock:
+            if self._birthdays is None:
+                return None
+            if not self._foreign_changes and self._birthdays_signature == self._dates_signature():
+                return []
+
+        with self._lock, _file_lock(self.dates_filepath):
+            self._sync_birthdays()
+            changes, self._foreign_changes = self._foreign_changes, []
+            return changes
+
+    def add_birthday(self, guild_id: int, name: str, date: str) -> None:
+        """Adds or replaces the birthday for given guild and name."""
+        with self._locked_birthdays():
+            self._birthdays[(guild_id, name)] = date
+            self._append_to_journal((_JOURNAL_ADD, guild_id, name, date))
+
+    def add_birthdays(self, rows: list[tuple[int, str, str]]) -> None:
+        """
+        Adds or replaces many birthdays with a single append to the journal.
+
+        Args:
+            rows: list of `(guild_id, name, date)` tuples
+        """
+        with self._locked_birthdays():
+            for guild_id, name, date in rows:
+                self._birthdays[(guild_id, name)] = date
+            self._append_to_journal(*[(_JOURNAL_ADD, guild_id, name, date) for guild_id, name, date in rows])
+
+    def remove_birthday(self, guild_id: int, name: str) -> None:
+        """Removes the birthday for given guild and name if it exists."""
+        with self._locked_birthdays():
+            if self._birthdays.pop((guild_id, name), None) is not None:
+                self._append_to_journal((_JOURNAL_REMOVE, guild_id, name, ""))
+
+    def compact(self) -> None:
+        """Merges the journal into the dates file and empties the journal."""
+        with self._locked_birthdays():
+            self._compact()
+
+    async def run_periodic_compaction(self, interval: int = JOURNAL_COMPACTION_INTERVAL):
+        """
+        Loop to merge the journal into the dates file every `interval` seconds if it is not empty.
+
+        A failed compaction is logged and retried after the next interval.
+        This is executed as task in the handler for the 'on_ready' bot event.
+
+        Args:
+            interval: number of seconds between two compactions
+        """
+        while True:
+            await asyncio.sleep(interval)
+            if self._journal_size > 0:
+                try:
+                    await run_blocking(self.compact)
+                except Exception:
+                    traceback.print_exc()
+
+    def load_subscriptions(self) -> list[tuple[int, int | None, str | None, str | None, str | None, str | None]]:
+        """
+        Reads all subscribed channels with their publish settings and the date they were last published to.
+
+        Files written before the settings were stored only contain the channel ids,
+        the missing columns are read as `None`.
+
+        Returns:
+            List of `(channel_id, guild_id, publish_time, timezone, last_published, reminder_days)` tuples.
+        """
+        with self._lock, _file_lock(self.subscriptions_filepath):
+            self._read_subscriptions()
+            return [(channel_id, *settings) for channel_id, settings in self._subscriptions.items()]
+
+    def add_subscription(self, channel_id: int, guild_id: int, publish_time: str, timezone: str) -> None:
+        """Adds the channel to the subscriptions or replaces its publish settings if it is subscribed already."""
+        self.add_subscriptions([(channel_id, guild_id, publish_time, timezone)])
+
+    def add_subscriptions(self, rows: list[tuple[int, int, str, str]]) -> None:
+        """
+        Adds the channels to the subscriptions or replaces their publish settings, with a single write for all of them.
+
+        Args:
+            rows: list of `(channel_id, guild_id, publish_time, timezone)` tuples
+        """
+        with self._locked_subscriptions():
+            changed = False
+            for channel_id, guild_id, publish_time, timezone in rows:
+                kept = self._subscriptions.get(channel_id, (None,) * 5)[3:]
+                if self._subscriptions.get(channel_id) != (guild_id, publish_time, timezone, *kept):
+                    self._subscriptions[channel_id] = (guild_id, publish_time, timezone, *kept)
+                    changed = True
+            if changed:
+                self._write_subscriptions()
+
+    def set_reminder_days(self, channel_id: int, reminder_days: str) -> None:
+        """
+        Sets the days ahead of a birthday a reminder is published to the channel.
+
+        Args:
+            reminder_days: numbers of days separated by commas like `"1,7"`, empty for no reminders
+        """
+        with self._locked_subscriptions():
+            if channel_id in self._subscriptions:
+                self._subscriptions[channel_id] = (*self._subscriptions[channel_id][:4], reminder_days or None)
+                self._write_subscriptions()
+
+    def set_last_published(self, rows: list[tuple[int, str]]) -> None:
+        """
+        Records the date the channels were last published to, with a single write for all of them.
+
+        Args:
+            rows: list of `(channel_id, date)` tuples, channels that are not subscribed are skipped
+        """
+        with self._locked_subscriptions():
+            changed = False
+            for channel_id, date in rows:
+                if channel_id in self._subscriptions and self._subscriptions[channel_id][3] != date:
+                    guild_id, publish_time, timezone, _, reminder_days = self._subscriptions[channel_id]
+                    self._subscriptions[channel_id] = (guild_id, publish_time, timezone, date, reminder_days)
+                    changed = True
+            if changed:
+                self._write_subscriptions()
+
+    def remove_subscription(self, channel_id: int) -> None:
+        """Removes the channel from the subscriptions if it is subscribed."""
+        with self._locked_subscriptions():
+            if channel_id in self._subscriptions:
+                del self._subscriptions[channel_id]
+                self._write_subscriptions()
+
+    @contextmanager
+    def _locked_birthdays(self):
+        """Holds both locks of the birthdays and makes sure the cached birthdays match the files."""
+        with self._lock, _file_lock(self.dates_filepath):
+            if self._birthdays is None:
+                self._read_birthdays()
+            else:
+                self._sync_birthdays()
+            yield
+
+    @contextmanager
+    def _locked_subscriptions(self):
+        """Holds both locks of the subscriptions and makes sure the cached subscriptions match the file."""
+        with self._lock, _file_lock(self.subscriptions_filepath):
+            if self._subscriptions is None or self._subscriptions_signature != _signature(self.subscriptions_filepath):
+                self._read_subscriptions()
+            yield
+
+    def _dates_signature(self):
+        return _signature(self.dates_filepath, self.journal_filepath)
+
+    def _read_birthdays(self) -> None:
+        self._birthdays = {}
+        if os.path.exists(self.dates_filepath):
+            with open(self.dates_filepath, newline="", encoding="utf-8") as dates_file:
+                for row in csv.DictReader(dates_file):
+                    self._birthdays[(int(row["guild_id"]), row["name"])] = row["date"]
+
+        self._journal_size = 0
+        self._replay_journal()
+        self._birthdays_signature = self._dates_signature()
+
+    def _sync_birthdays(self) -> None:
+        """Applies the changes other processes made since the files were last read or written by this storage."""
+        signature = self._dates_signature()
+        if signature == self._birthdays_signature:
+            return
+
+        (dates_state, journal_state), (known_dates_state, known_journal_state) = signature, self._birthdays_signature
+        if (dates_state == known_dates_state and journal_state is not None and known_journal_state is not None
+                and journal_state[0] == known_journal_state[0] and journal_state[2] >= self._journal_size):
+            # Other processes only appended to the journal
+            self._foreign_changes.extend(self._replay_journal())
+        else:
+            # Another process compacted the journal, the changes are found by comparing all rows
+            known = self._birthdays
+            self._read_birthdays()
+            self._foreign_changes.extend(_diff(known, self._birthdays))
+        self._birthdays_signature = self._dates_signature()
+
+    def _read_subscriptions(self) -> None:
+        self._subscriptions = {}
+        if os.path.exists(self.subscriptions_filepath):
+            with open(self.subscriptions_filepath, newline="", encoding="utf-8") as subscriptions_file:
+                for row in csv.DictReader(subscriptions_file):
+                    guild_id = row.get("guild_id")
+                    self._subscriptions[int(row["channel_id"])] = (int(guild_id) if guild_id else None,
+                                                                   row.get("publish_time") or None,
+                                                                   row.get("timezone") or None,
+                                                                   row.get("last_published") or None,
+                                                                   row.get("reminder_days") or None)
+        self._subscriptions_signature = _signature(self.subscriptions_filepath)
+
+    def _replay_journal(self) -> list[tuple[int, str, str | None]]:
+        """
+        Applies the changes recorded in the journal after the already applied `_journal_size` bytes
+        to the cached birthdays.
+
+        Returns:
+            The applied changes as `(guild_id, name, date)` tuples, `date` is `None` for a removed birthday.
+        """
+        if not os.path.exists(self.journal_filepath):
+            self._journal_size = 0
+            return []
+
+        with open(self.journal_filepath, "rb") as journal:
+            journal.seek(self._journal_size)
+            tail = journal.read()
+        self._journal_size += len(tail)
+
+        changes = []
+        damaged = False
+        # A line cut off while being written can end inside a multibyte character, it is skipped below anyway
+        for row in csv.reader(io.StringIO(tail.decode("utf-8", errors="replace"), newline="")):
+            # Skip a line that was cut off while being written
+            if not _is_journal_row(row):
+                damaged = True
+                continue
+            operation, guild_id, name, date = row
+            if operation == _JOURNAL_ADD:
+                self._birthdays[(int(guild_id), name)] = date
+                changes.append((int(guild_id), name, date))
+            elif self._birthdays.pop((int(guild_id), name), None) is not None:
+                changes.append((int(guild_id), name, None))
+
+        # Start with an empty journal, so new entries are not appended to a damaged line
+        if damaged:
+            self._compact()
+
+        return changes
+
+    def _append_to_journal(self, *rows: tuple[str, int, str, str]) -> None:
+        with open(self.journal_filepath, "ab") as journal:
+            text = io.StringIO(newline="")
+            csv.writer(text).writerows(rows)
+            journal.write(text.getvalue().encode())
+            self._journal_size = journal.tell()
+
+        # Own changes replace the not yet handed out changes of other processes to the same birthdays
+        if self._foreign_changes:
+            written = {(guild_id, name) for _, guild_id, name, _ in rows}
+            self._foreign_changes = [change for change in self._foreign_changes if change[:2] not in written]
+
+        if self._journal_size > self.compaction_size:
+            self._compact()
+        else:
+            self._birthdays_signature = self._dates_signature()
+
+    def _compact(self) -> None:
+        # Replaying the journal again after a crash between both steps is harmless,
+        # because adding and removing entries is idempotent.
+        _replace_csv(self.dates_filepath, _DATES_HEADER,
+                     ((name, date, guild_id) for (guild_id, name), date in self._birthdays.items()))
+        open(self.journal_filepath, "w").close()
+        self._journal_size = 0
+        self._birthdays_signature = self._dates_signature()
+
+    def _write_subscriptions(self) -> None:
+        _replace_csv(self.subscriptions_filepath, _SUBSCRIPTIONS_HEADER,
+                     ((channel_id, *settings) for channel_id, settings in self._subscriptions.items()))
+        self._subscriptions_signature = _signature(self.subscriptions_filepath)
+
+
+def _diff(old: dict[tuple[int, str], str], new: dict[tuple[int, str], str]) -> list[tuple[int, str, str | None]]:
+    """Lists the changes from `old` to `new` birthdays as `(guild_id, name, date)` tuples."""
+    changes = [(guild_id, name, date) for (guild_id, name), date in new.items() if old.get((guild_id, name)) != date]
+    changes.extend((guild_id, name, None) for guild_id, name in old.keys() - new.keys())
+    return changes
+
+
+def _is_journal_row(row: list[str]) -> bool:
+    """
+    Checks if the row is a complete journal entry.
+
+    A line cut off while being written can still have four fields, e.g. with the date cut off,
+    so the guild id and the date of an added entry are validated as well.
+    """
+    if len(row) != 4 or row[0] not in (_JOURNAL_ADD, _JOURNAL_REMOVE) or not row[1].isdigit():
+        return False
+    return row[0] == _JOURNAL_REMOVE or datetime_tools.check_date_format(row[3])
+
+
+@contextmanager
+def _file_lock(filepath: str):
+    """
+    Holds an exclusive advisory lock on `filepath + ".lock"`, so no other process accesses the file meanwhile.
+
+    Without `fcntl` (on Windows) only the locks within this process are held.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    with open(filepath + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Closing the file releases the lock
+        yield
+
+
+def _signature(*filepaths: str) -> tuple:
+    """
+    Identifies the current state of the files by inode, modification time and size.
+
+    Rewritten files get a new inode (see `_replace_csv`) and appended files grow,
+    so the signature changes with every write.
+    """
+    signature = []
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            signature.append(None)
+        else:
+            signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _replace_csv(filepath: str, header: list[str], rows) -> None:
+    """Writes the rows to a temporary file and renames it to `filepath`, which replaces the file atomically."""
+    temp_filepath = f"{filepath}.{os.getpid()}.tmp"
+    with open(temp_filepath, "w", newline="", encoding="utf-8") as temp_file:
+        writer = csv.writer(temp_file, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(rows)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_filepath, filepath)
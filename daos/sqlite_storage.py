@@ -0,0 +1,293 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from config import CHANGE_LOG_RETENTION, DATABASE_FILEPATH
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS birthdays (
+    guild_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    PRIMARY KEY (guild_id, name)
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    channel_id INTEGER PRIMARY KEY,
+    guild_id INTEGER,
+    publish_time TEXT,
+    timezone TEXT,
+    last_published TEXT,
+    reminder_days TEXT
+);
+-- Log of the changes to the birthdays by any connection, so other processes can apply only the changed rows.
+-- `date` is NULL for a removed birthday.
+CREATE TABLE IF NOT EXISTS birthday_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    date TEXT,
+    changed_at INTEGER NOT NULL
+);
+-- Id of the last change deleted from the log after CHANGE_LOG_RETENTION
+CREATE TABLE IF NOT EXISTS birthday_changes_pruned (
+    through INTEGER NOT NULL
+);
+INSERT INTO birthday_changes_pruned SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM birthday_changes_pruned);
+CREATE TRIGGER IF NOT EXISTS birthday_inserted AFTER INSERT ON birthdays
+BEGIN
+    INSERT INTO birthday_changes (guild_id, name, date, changed_at)
+    VALUES (new.guild_id, new.name, new.date, CAST(strftime('%s', 'now') AS INTEGER));
+END;
+CREATE TRIGGER IF NOT EXISTS birthday_updated AFTER UPDATE ON birthdays
+BEGIN
+    INSERT INTO birthday_changes (guild_id, name, date, changed_at)
+    VALUES (old.guild_id, old.name, NULL, CAST(strftime('%s', 'now') AS INTEGER)),
+           (new.guild_id, new.name, new.date, CAST(strftime('%s', 'now') AS INTEGER));
+END;
+CREATE TRIGGER IF NOT EXISTS birthday_deleted AFTER DELETE ON birthdays
+BEGIN
+    INSERT INTO birthday_changes (guild_id, name, date, changed_at)
+    VALUES (old.guild_id, old.name, NULL, CAST(strftime('%s', 'now') AS INTEGER));
+END;
+"""
+
+# Seconds between two deletions of outdated changes from the log
+_PRUNE_INTERVAL = 60 * 60
+
+# Columns added to the subscriptions table after its first version, added to older databases on connect
+_SUBSCRIPTION_COLUMNS = {"guild_id": "INTEGER", "publish_time": "TEXT", "timezone": "TEXT", "last_published": "TEXT",
+                         "reminder_days": "TEXT"}
+
+
+class SqliteStorage:
+    """
+    Storage backend keeping birthdays and subscriptions in an indexed SQLite database.
+
+    Birthdays are unique per `(guild_id, name)` and subscriptions per `channel_id`,
+    so every write is a single keyed statement executed in its own transaction.
+    The database runs in WAL mode, so readers are not blocked by a running write.
+    Several processes can share the database. Triggers log every change to the birthdays,
+    so `birthday_changes` hands out only the rows other processes changed since the last read.
+    """
+    def __init__(self, filepath: str = DATABASE_FILEPATH):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        # Id of the last change in the log already known to the reader of `load_birthdays`
+        self._change_cursor: int | None = None
+        # Ranges `(after, through]` of change ids written by this storage, they are not handed out
+        self._own_changes: list[tuple[int, int]] = []
+        self._last_prune: float | None = None
+        self._connection = sqlite3.connect(filepath, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        self._migrate()
+
+    def load_birthdays(self) -> list[tuple[str, str, int]]:
+        """
+        Reads all birthdays of all guilds.
+
+        Returns:
+            List of `(name, date, guild_id)` tuples.
+        """
+        with self._lock, self._connection:
+            # Reading both in one transaction, so the position in the change log matches the rows
+            self._connection.execute("BEGIN")
+            self._change_cursor = self._last_change_id()
+            self._own_changes = []
+            return self._connection.execute("SELECT name, date, guild_id FROM birthdays").fetchall()
+
+    def birthday_changes(self) -> list[tuple[int, str, str | None]] | None:
+        """
+        Collects the changes other processes made to the birthdays since the last call or `load_birthdays`.
+
+        Changes this storage made itself are not included, neither are changes replaced by a later own change.
+
+        Returns:
+            List of `(guild_id, name, date)` tuples, `date` is `None` for a removed birthday,
+            or `None` if the birthdays were not loaded yet or the changes were already deleted from the log
+            and all birthdays have to be loaded again.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            if self._change_cursor is None:
+                return None
+            pruned_through = self._connection.execute("SELECT through FROM birthday_changes_pruned").fetchone()[0]
+            if pruned_through > self._change_cursor:
+                return None
+
+            rows = self._connection.execute(
+                "SELECT id, guild_id, name, date FROM birthday_changes WHERE id > ? ORDER BY id",
+                (self._change_cursor,)).fetchall()
+            if not rows:
+                return []
+
+            # The last change of every birthday decides, it is left out if it was an own change
+            latest = {}
+            for change_id, guild_id, name, date in rows:
+                own = any(after < change_id <= through for after, through in self._own_changes)
+                latest[guild_id, name] = (date, own)
+
+            self._change_cursor = rows[-1][0]
+            self._own_changes = [(after, through) for after, through in self._own_changes
+                                 if through > self._change_cursor]
+            return [(guild_id, name, date) for (guild_id, name), (date, own) in latest.items() if not own]
+
+    def add_birthday(self, guild_id: int, name: str, date: str) -> None:
+        """Adds or replaces the birthday for given guild and name."""
+        with self._birthdays_transaction():
+            self._connection.execute(
+                "INSERT OR REPLACE INTO birthdays (guild_id, name, date) VALUES (?, ?, ?)",
+                (guild_id, name, date))
+
+    def add_birthdays(self, rows: list[tuple[int, str, str]]) -> None:
+        """
+        Adds or replaces many birthdays in a single transaction.
+
+        Args:
+            rows: list of `(guild_id, name, date)` tuples
+        """
+        with self._birthdays_transaction():
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO birthdays (guild_id, name, date) VALUES (?, ?, ?)", rows)
+
+    def remove_birthday(self, guild_id: int, name: str) -> None:
+        """Removes the birthday for given guild and name if it exists."""
+        with self._birthdays_transaction():
+            self._connection.execute(
+                "DELETE FROM birthdays WHERE guild_id = ? AND name = ?", (guild_id, name))
+
+    def load_subscriptions(self) -> list[tuple[int, int | None, str | None, str | None, str | None, str | None]]:
+        """
+        Reads all subscribed channels with their publish settings and the date they were last published to.
+
+        Returns:
+            List of `(channel_id, guild_id, publish_time, timezone, last_published, reminder_days)` tuples.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT channel_id, guild_id, publish_time, timezone, last_published, reminder_days "
+                "FROM subscriptions").fetchall()
+
+    def add_subscription(self, channel_id: int, guild_id: int, publish_time: str, timezone: str) -> None:
+        """Adds the channel to the subscriptions or replaces its publish settings if it is subscribed already."""
+        self.add_subscriptions([(channel_id, guild_id, publish_time, timezone)])
+
+    def add_subscriptions(self, rows: list[tuple[int, int, str, str]]) -> None:
+        """
+        Adds the channels to the subscriptions or replaces their publish settings in a single transaction.
+
+        Args:
+            rows: list of `(channel_id, guild_id, publish_time, timezone)` tuples
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO subscriptions (channel_id, guild_id, publish_time, timezone) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (channel_id) DO UPDATE SET guild_id = excluded.guild_id, "
+                "publish_time = excluded.publish_time, timezone = excluded.timezone",
+                rows)
+
+    def set_reminder_days(self, channel_id: int, reminder_days: str) -> None:
+        """
+        Sets the days ahead of a birthday a reminder is published to the channel.
+
+        Args:
+            reminder_days: numbers of days separated by commas like `"1,7"`, empty for no reminders
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE subscriptions SET reminder_days = ? WHERE channel_id = ?", (reminder_days or None, channel_id))
+
+    def set_last_published(self, rows: list[tuple[int, str]]) -> None:
+        """
+        Records the date the channels were last published to in a single transaction.
+
+        Args:
+            rows: list of `(channel_id, date)` tuples, channels that are not subscribed are skipped
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE subscriptions SET last_published = ? WHERE channel_id = ?",
+                [(date, channel_id) for channel_id, date in rows])
+
+    def remove_subscription(self, channel_id: int) -> None:
+        """Removes the channel from the subscriptions if it is subscribed."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM subscriptions WHERE channel_id = ?", (channel_id,))
+
+    def import_from(self, source) -> tuple[int, int]:
+        """
+        Copies all birthdays and subscriptions of another storage backend in one transaction.
+
+        Entries that already exist in the database are kept.
+
+        Args:
+            source: storage backend to read from, e.g. a `CsvStorage`
+
+        Returns:
+            Number of birthdays and number of subscriptions read from the source.
+        """
+        birthdays = source.load_birthdays()
+        subscriptions = source.load_subscriptions()
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO birthdays (name, date, guild_id) VALUES (?, ?, ?)",
+                birthdays)
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO subscriptions "
+                "(channel_id, guild_id, publish_time, timezone, last_published, reminder_days) "
+                "VALUES (?, ?, ?, ?, ?, ?)", subscriptions)
+
+        return len(birthdays), len(subscriptions)
+
+    @contextmanager
+    def _birthdays_transaction(self):
+        """
+        Write transaction on the birthdays whose own changes are not handed out by `birthday_changes`.
+
+        The transaction takes the write lock of the database right away, so all changes logged between
+        reading the last change id before and after the writes are own changes.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            before = self._last_change_id()
+            yield
+            after = self._last_change_id()
+            if after > before:
+                self._own_changes.append((before, after))
+            if self._last_prune is None or time.monotonic() - self._last_prune > _PRUNE_INTERVAL:
+                self._prune_changes()
+
+    def _last_change_id(self) -> int:
+        row = self._connection.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'birthday_changes'").fetchone()
+        return row[0] if row else 0
+
+    def _prune_changes(self) -> None:
+        """Deletes the changes older than CHANGE_LOG_RETENTION from the log."""
+        self._last_prune = time.monotonic()
+        through = self._connection.execute(
+            "SELECT MAX(id) FROM birthday_changes WHERE changed_at < ?",
+            (int(time.time()) - CHANGE_LOG_RETENTION,)).fetchone()[0]
+        if through is not None:
+            self._connection.execute("DELETE FROM birthday_changes WHERE id <= ?", (through,))
+            self._connection.execute("UPDATE birthday_changes_pruned SET through = ?", (through,))
+
+    def _migrate(self) -> None:
+        """Adds the columns missing in databases created by an older version of the bot."""
+        existing = {row[1] for row in self._connection.execute("PRAGMA table_info(subscriptions)")}
+        with self._connection:
+            for column, column_type in _SUBSCRIPTION_COLUMNS.items():
+                if column not in existing:
+                    self._connection.execute(f"ALTER TABLE subscriptions ADD COLUMN {column} {column_type}")
+
+
+if __name__ == "__main__":
+    # One-shot import of the CSV files into the database: `python -m daos.sqlite_storage`
+    from daos.csv_storage import CsvStorage
+
+    n_birthdays, n_subscriptions = SqliteStorage().import_from(CsvStorage())
+    print(f"Imported {n_birthdays} birthdays and {n_subscriptions} subscriptions into {DATABASE_FILEPATH}")
@@ -0,0 +1,49 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+
+from config import STORAGE_BACKEND, STORAGE_EXECUTOR_WORKERS
+from utils.metrics import storage_call_duration
+
+# Bounded pool of threads for blocking file and database I/O
+_executor = ThreadPoolExecutor(max_workers=STORAGE_EXECUTOR_WORKERS,
+                               thread_name_prefix="storage")
+
+
+@cache
+def get_storage():
+    """
+    Creates the storage backend selected by `STORAGE_BACKEND` in config.py.
+
+    The backend is created once and shared by all DAOs of this process.
+
+    Returns:
+        A `CsvStorage` or `SqliteStorage` instance.
+    """
+    if STORAGE_BACKEND == "csv":
+        from daos.csv_storage import CsvStorage
+        return CsvStorage()
+    if STORAGE_BACKEND == "sqlite":
+        from daos.sqlite_storage import SqliteStorage
+        return SqliteStorage()
+
+    raise ValueError(f"Unknown storage backend in config.py: {STORAGE_BACKEND}")
+
+
+async def run_blocking(func, *args):
+    """
+    Runs a blocking storage call in the storage thread pool, so the event loop is not blocked meanwhile.
+
+    The duration of the call (including the time waiting for a free thread) is recorded per function name.
+
+    Args:
+        func: the blocking function
+        *args: arguments passed to `func`
+
+    Returns:
+        The return value of `func`.
+    """
+    loop = asyncio.get_running_loop()
+    with storage_call_duration.time(call=func.__name__):
+        return await loop.run_in_executor(_executor, functools.partial(func, *args))
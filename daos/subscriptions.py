@@ -1,45 +1,86 @@
-import pandas as pd
+from datetime import date as Date
+
 from disnake.abc import GuildChannel
-from config import SUBSCRIPTIONS_FILEPATH
+from config import DEFAULT_TIMEZONE, PUBLISH_BIRTHDAYS_TIME
+from daos.storage import get_storage, run_blocking
+from utils import datetime_tools
 
 class Subscriptions():
     @staticmethod
-    def all() -> list[int]:
+    async def all() -> list[tuple[int, int | None, str, str, Date | None, tuple[int, ...]]]:
         """
-        Reads channel ids to be scheduled and returns them as list.
+        Reads the subscribed channels to be scheduled with their publish settings.
+
+        Subscriptions saved without settings get PUBLISH_BIRTHDAYS_TIME and DEFAULT_TIMEZONE from config.py.
 
         Returns:
-            List of ids of subscribed channels
+            List of `(channel_id, guild_id, publish_time, timezone, last_published, reminder_days)` tuples,
+            `guild_id` is `None` for subscriptions saved without it,
+            `last_published` is `None` if nothing was published to the channel yet,
+            `reminder_days` is empty if no reminders are set.
         """
-        df_subs = pd.read_csv(SUBSCRIPTIONS_FILEPATH)
-        subs_list = df_subs["channel_id"].values.tolist()
-        return subs_list
+        return [
+            (channel_id, guild_id, publish_time or PUBLISH_BIRTHDAYS_TIME, timezone or DEFAULT_TIMEZONE,
+             datetime_tools.string_to_date(last_published) if last_published else None,
+             tuple(int(days) for days in reminder_days.split(",")) if reminder_days else ())
+            for channel_id, guild_id, publish_time, timezone, last_published, reminder_days
+            in await run_blocking(get_storage().load_subscriptions)
+        ]
 
     @staticmethod
-    def save(channel: GuildChannel):
+    async def save(channel: GuildChannel, publish_time: str, timezone: str):
         """
-        Saves the given channel to be scheduled again on start-up.
+        Saves the given channel with its publish settings to be scheduled again on start-up.
 
         Args:
-            guild_channel: disnake.abc.GuildChannel
+            channel: disnake.abc.GuildChannel
+            publish_time: time of day in format `"HH:MM"`
+            timezone: IANA name of the timezone of `publish_time`
         """
-        df = pd.read_csv(SUBSCRIPTIONS_FILEPATH)
-        if not any(df.channel_id == channel.id):
-            df = pd.concat(
-                [df, pd.DataFrame({"channel_id": [channel.id]})],
-                ignore_index=True,
-            )
-            df.to_csv(SUBSCRIPTIONS_FILEPATH, index=False)
+        await run_blocking(get_storage().add_subscription, channel.id, channel.guild.id, publish_time, timezone)
 
     @staticmethod
-    def delete(channel: GuildChannel):
+    async def save_many(subscriptions: list[tuple[GuildChannel, str, str]]):
         """
-        Deletes the given channel from the repo.
+        Saves the given channels with their publish settings at once, e.g. when migrating old subscriptions.
+
+        Args:
+            subscriptions: list of `(channel, publish_time, timezone)` tuples
+        """
+        if subscriptions:
+            await run_blocking(get_storage().add_subscriptions,
+                               [(channel.id, channel.guild.id, publish_time, timezone)
+                                for channel, publish_time, timezone in subscriptions])
+
+    @staticmethod
+    async def save_reminder_days(channel: GuildChannel, reminder_days: tuple[int, ...]):
+        """
+        Saves the days ahead of a birthday a reminder is published to the given subscribed channel.
 
         Args:
             channel: disnake.abc.GuildChannel
+            reminder_days: numbers of days, empty for no reminders
         """
-        df_subs = pd.read_csv(SUBSCRIPTIONS_FILEPATH)
-        df_subs = df_subs.drop(df_subs[df_subs['channel_id'] == channel.id].index)
+        await run_blocking(get_storage().set_reminder_days, channel.id, ",".join(map(str, reminder_days)))
 
-        df_subs.to_csv(SUBSCRIPTIONS_FILEPATH, index=False)
+    @staticmethod
+    async def mark_published(published: list[tuple[int, Date]]):
+        """
+        Saves the date the channels were last published to, so a restart does not publish to them again that day.
+
+        Args:
+            published: list of `(channel_id, date)` tuples
+        """
+        if published:
+            await run_blocking(get_storage().set_last_published,
+                               [(channel_id, datetime_tools.date_to_string(date)) for channel_id, date in published])
+
+    @staticmethod
+    async def delete(channel: GuildChannel):
+        """
+        Deletes the given channel from the repo.
+
+        Args:
+            channel: disnake.abc.GuildChannel
+        """
+        await run_blocking(get_storage().remove_subscription, channel.id)
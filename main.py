@@ -1,20 +1,39 @@
+import disnake
 from disnake.ext import commands
 
 import os
 from dotenv import load_dotenv
 
 import asyncio
+import time
 from datetime import datetime
 from pprint import pprint
 
 from daos.subscriptions import Subscriptions
-from utils import subscriptions_controller
+from daos.birthday_store import birthday_store
+from daos.csv_storage import CsvStorage
+from daos.storage import get_storage
+from utils import loop_monitor, metrics, subscriptions_controller
+from utils.sharding import ShardRange
 from cogs.subscription_commands import SubscriptionCommands
+from config import CHANNEL_FETCH_CONCURRENCY, METRICS_HOST, METRICS_LOG_INTERVAL, METRICS_PORT
 
 load_dotenv()
 TOKEN = os.environ["DISCORD_TOKEN"]
 
-bot = commands.InteractionBot()
+# Shards run by this process, every process only loads and schedules the guilds of its shards
+shards = ShardRange.from_environment()
+
+if shards.is_sharded:
+    bot = commands.AutoShardedInteractionBot(shard_count=shards.shard_count, shard_ids=shards.shard_ids)
+else:
+    bot = commands.InteractionBot()
+
+# Set once the background tasks are started, 'on_ready' runs again after every reconnect
+_background_tasks_started = False
+
+# Start times of the running slash command handlers per interaction id
+_command_starts: dict[int, float] = {}
 
 
 def main():
@@ -23,25 +42,124 @@ def main():
     # bot.load_extension("cogs.bot_management_commands")
     bot.load_extensions("./cogs")
 
+    print(f"Running {shards}")
+
+    # Read stored birthdays once, all further reads are answered from memory.
+    # Interactions of a guild always arrive at the process running its shard, so that process is the only bot
+    # changing the guild's birthdays. Changes by other processes (e.g. admin scripts) are reloaded by the watcher.
+    birthday_store.guild_filter = shards.owns
+    birthday_store.load()
+
     bot.run(TOKEN)
 
 
 @bot.event
 async def on_ready():
+    start = time.monotonic()
     print_start_message()
 
-    # Load saved subscriptions
-    subs_list = Subscriptions.all()
-    
-    channels = [
-        await bot.fetch_channel(channel_id) for channel_id in subs_list
-    ]
-    await asyncio.gather(*[
-        SubscriptionCommands.subscribe_channel(channel) for channel in channels
-    ])
+    # Load saved subscriptions of the guilds of this process' shards,
+    # those without guild id are resolved first to find out their guild
+    subs_list = [subscription for subscription in await Subscriptions.all()
+                 if subscription[1] is None or shards.owns(subscription[1])]
+    resolved = await resolve_channels([channel_id for channel_id, *_ in subs_list])
+    channels = {channel.id: channel for channel in resolved if shards.owns(channel.guild.id)}
+    restored = [(channels[channel_id], publish_time, timezone, last_published, reminder_days)
+                for channel_id, _, publish_time, timezone, last_published, reminder_days in subs_list
+                if channel_id in channels]
+    subscriptions_controller.restore_tasks(restored)
+
+    # Subscriptions saved by older versions lack the guild id and publish settings, save them once completed
+    await Subscriptions.save_many([(channels[channel_id], publish_time, timezone)
+                                   for channel_id, guild_id, publish_time, timezone, *_ in subs_list
+                                   if guild_id is None and channel_id in channels])
+
+    # Channels that could not be resolved are kept in the repo, but nothing is published to them until the next start
+    unresolved = len(subs_list) - len(resolved)
+    print(f"Restored {len(restored)} of {len(subs_list)} subscriptions in {time.monotonic() - start:.2f} s, "
+          f"{unresolved} channels could not be resolved")
 
     # Run periodically scheduled tasks
-    bot.loop.create_task(subscriptions_controller.run_scheduled_jobs(sleep=1))
+    subscriptions_controller.start_dispatcher(SubscriptionCommands.publish_daily_birthdays)
+    start_background_tasks()
+
+    # Publish what was missed while the bot was offline, channels published to today are skipped.
+    # Sending to many channels takes minutes because of the rate limit, so it runs in the background.
+    bot.loop.create_task(subscriptions_controller.catch_up_missed_runs())
+
+    # Started last, the bot runs on without metrics endpoint if it cannot be served
+    if METRICS_PORT:
+        # Processes on the same host running different shards each need their own port
+        await metrics.serve_metrics(METRICS_HOST, METRICS_PORT + (shards.shard_ids[0] if shards.is_partial else 0))
+
+
+@bot.before_slash_command_invoke
+async def start_command_timer(inter: disnake.ApplicationCommandInteraction):
+    _command_starts[inter.id] = time.perf_counter()
+
+
+@bot.after_slash_command_invoke
+async def stop_command_timer(inter: disnake.ApplicationCommandInteraction):
+    start = _command_starts.pop(inter.id, None)
+    if start is not None:
+        status = "error" if inter.command_failed else "ok"
+        metrics.command_duration.observe(time.perf_counter() - start,
+                                         command=inter.application_command.qualified_name, status=status)
+
+
+def start_background_tasks():
+    """Starts the loops running for the whole lifetime of the bot, calling it again (e.g. on reconnect) does nothing."""
+    global _background_tasks_started
+    if _background_tasks_started:
+        return
+    _background_tasks_started = True
+
+    bot.loop.create_task(loop_monitor.monitor_event_loop_lag())
+    bot.loop.create_task(birthday_store.watch_storage())
+    if METRICS_LOG_INTERVAL:
+        bot.loop.create_task(metrics.log_metrics())
+    if isinstance(get_storage(), CsvStorage):
+        bot.loop.create_task(get_storage().run_periodic_compaction())
+
+
+async def resolve_channels(channel_ids: list[int]) -> list[disnake.abc.GuildChannel]:
+    """
+    Resolves the given channel ids to channel objects.
+
+    Channels in the gateway cache are taken from there, only the remaining ones are fetched concurrently
+    (at most `CHANNEL_FETCH_CONCURRENCY` requests at the same time).
+    Channels that cannot be fetched are skipped.
+
+    Args:
+        channel_ids: ids of the channels to resolve
+
+    Returns:
+        List of the resolved channels.
+    """
+    channels = []
+    missing_ids = []
+    for channel_id in channel_ids:
+        channel = bot.get_channel(channel_id)
+        if channel is not None:
+            channels.append(channel)
+        else:
+            missing_ids.append(channel_id)
+
+    semaphore = asyncio.Semaphore(CHANNEL_FETCH_CONCURRENCY)
+
+    async def fetch(channel_id):
+        async with semaphore:
+            try:
+                return await bot.fetch_channel(channel_id)
+            except (disnake.HTTPException, disnake.InvalidData) as e:
+                # InvalidData: the channel is of a type or in a guild unknown to the gateway cache
+                print(f"Channel {channel_id} could not be fetched ({e}), skipping it.")
+                return None
+
+    fetched = await asyncio.gather(*[fetch(channel_id) for channel_id in missing_ids])
+    channels.extend(channel for channel in fetched if channel is not None)
+
+    return channels
 
 
 def print_start_message():
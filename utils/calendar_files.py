@@ -0,0 +1,153 @@
+import csv
+import hashlib
+from datetime import date as Date, datetime, timezone
+from typing import Iterable, Iterator
+
+from utils import datetime_tools
+
+
+def iter_csv_birthdays(lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+    """
+    Parses birthdays from CSV lines with the columns `name` and `date` (header optional).
+
+    The lines are parsed one after another, so the file never has to be held in memory as a whole.
+
+    Args:
+        lines: iterable of text lines, e.g. an opened text file
+
+    Yields:
+        `(name, date)` tuples as found in the file, the date is not validated.
+        Rows with less than two columns yield an empty date.
+    """
+    for i, row in enumerate(csv.reader(lines)):
+        if not row:
+            continue
+        if i == 0 and [column.strip().lower() for column in row[:2]] == ["name", "date"]:
+            continue
+        yield row[0].strip(), row[1].strip() if len(row) > 1 else ""
+
+
+def iter_ics_birthdays(lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+    """
+    Parses birthdays from the events of an iCalendar file (`SUMMARY` is the name, `DTSTART` the date).
+
+    The lines are parsed one after another, so the file never has to be held in memory as a whole.
+
+    Args:
+        lines: iterable of text lines, e.g. an opened text file
+
+    Yields:
+        `(name, date)` tuples with the date formatted as in config.py, or an empty date if it could not be read.
+    """
+    event = None
+    for line in _unfold_ics_lines(lines):
+        key, _, value = line.partition(":")
+        key = key.split(";")[0].upper()
+
+        if key == "BEGIN" and value.upper() == "VEVENT":
+            event = {}
+        elif event is not None and key == "END" and value.upper() == "VEVENT":
+            yield _unescape_ics_text(event.get("SUMMARY", "")).strip(), _ics_to_date_string(event.get("DTSTART", ""))
+            event = None
+        elif event is not None and key in ("SUMMARY", "DTSTART"):
+            event[key] = value
+
+
+def iter_csv_lines(birthdays: Iterable[tuple[str, Date]]) -> Iterator[str]:
+    """
+    Formats birthdays as CSV lines with the columns `name` and `date` as read by `iter_csv_birthdays`.
+
+    Args:
+        birthdays: iterable of `(name, date)` tuples
+
+    Yields:
+        One line per birthday after the header line.
+    """
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(["name", "date"])
+    yield buffer.pop()
+    for name, date in birthdays:
+        writer.writerow([name, datetime_tools.date_to_string(date)])
+        yield buffer.pop()
+
+
+def iter_ics_lines(birthdays: Iterable[tuple[str, Date]], guild_id: int) -> Iterator[str]:
+    """
+    Formats birthdays as iCalendar file with one yearly recurring all-day event per birthday.
+
+    Args:
+        birthdays: iterable of `(name, date)` tuples
+        guild_id: id of the guild the birthdays belong to, used for the event ids
+
+    Yields:
+        Lines of the iCalendar file (with CRLF line endings).
+    """
+    yield "BEGIN:VCALENDAR\r\n"
+    yield "VERSION:2.0\r\n"
+    yield "PRODID:-//BirthdayGratulationBot//DE\r\n"
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    for name, date in birthdays:
+        uid = hashlib.sha1(f"{guild_id}:{name}".encode()).hexdigest()
+        yield "BEGIN:VEVENT\r\n"
+        yield f"UID:{uid}@birthday-gratulation-bot\r\n"
+        yield f"DTSTAMP:{timestamp}\r\n"
+        yield f"DTSTART;VALUE=DATE:{date.year:04d}{date:%m%d}\r\n"
+        yield "RRULE:FREQ=YEARLY\r\n"
+        yield f"SUMMARY:{_escape_ics_text(name)}\r\n"
+        yield "END:VEVENT\r\n"
+    yield "END:VCALENDAR\r\n"
+
+
+class _LineBuffer:
+    """Minimal file-like object collecting what a csv writer writes."""
+    def __init__(self):
+        self._parts = []
+
+    def write(self, text: str) -> None:
+        self._parts.append(text)
+
+    def pop(self) -> str:
+        text = "".join(self._parts)
+        self._parts.clear()
+        return text
+
+
+def _unfold_ics_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Joins the continuation lines (starting with a space or tab) of an iCalendar file."""
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def _ics_to_date_string(value: str) -> str:
+    """Converts an iCalendar date (`YYYYMMDD` optionally followed by a time) to the date format of config.py."""
+    try:
+        date = datetime.strptime(value.strip()[:8], "%Y%m%d")
+    except ValueError:
+        return ""
+    return datetime_tools.date_to_string(date)
+
+
+def _escape_ics_text(text: str) -> str:
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n"))
+
+
+def _unescape_ics_text(text: str) -> str:
+    result = []
+    chars = iter(text)
+    for char in chars:
+        if char == "\\":
+            escaped = next(chars, "")
+            result.append("\n" if escaped in ("n", "N") else escaped)
+        else:
+            result.append(char)
+    return "".join(result)
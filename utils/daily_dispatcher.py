@@ -0,0 +1,189 @@
+import asyncio
+import heapq
+import itertools
+import time as _time
+import traceback
+from datetime import datetime, time, timedelta
+from typing import Hashable, NamedTuple
+
+from utils import datetime_tools
+from utils.metrics import scheduler_lag
+
+
+def next_fire_time(time_of_day: str, after: float, timezone: str | None = None) -> float:
+    """
+    Calculates the next point in time the given time of day is reached in the given timezone.
+
+    The calculation uses the wall clock of the timezone, so the result stays at the same time of day
+    when daylight saving time starts or ends. A time that is skipped when the clocks are set forward
+    is reached as many minutes after the skipped hour.
+
+    Args:
+        time_of_day: time in format `"HH:MM"`
+        after: unix timestamp the result has to be later than
+        timezone (default: DEFAULT_TIMEZONE from config.py): IANA name of the timezone
+
+    Returns:
+        The unix timestamp of the next occurrence of `time_of_day` after `after`.
+    """
+    tz = datetime_tools.get_timezone(timezone)
+    hour, minute = map(int, time_of_day.split(":"))
+    day = datetime.fromtimestamp(after, tz).date()
+
+    target = datetime.combine(day, time(hour, minute), tzinfo=tz).timestamp()
+    if target <= after:
+        target = datetime.combine(day + timedelta(days=1), time(hour, minute), tzinfo=tz).timestamp()
+
+    return target
+
+
+class _Job(NamedTuple):
+    time_of_day: str
+    timezone: str | None
+    next_run: float
+    # Identifies the heap entry of the current next run, older entries of the job are outdated
+    sequence: int
+
+
+class DailyDispatcher:
+    """
+    Runs a coroutine function every day at the time of day and timezone of each scheduled job.
+
+    The next run of every job is kept in a heap ordered by time, so a single task sleeps until the earliest
+    run instead of polling all jobs. All jobs due at the same time are passed to the callback at once,
+    every call runs as its own task, so a long run (e.g. sending to many channels) does not delay the next one.
+    Rescheduling or removing a job does not search the heap: the outdated heap entry stays and is skipped
+    when it is reached, the heap is rebuilt once outdated entries make up the larger part of it.
+    """
+    def __init__(self, callback):
+        """
+        Args:
+            callback: coroutine function that is awaited with a list of `(key, run time)` tuples of the due
+                      jobs, the run time is a timezone aware datetime in the timezone of the job
+        """
+        self.callback = callback
+        self._jobs: dict[Hashable, _Job] = {}
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._sequence = itertools.count()
+        self._task: asyncio.Task | None = None
+        # Running callback tasks, referenced until they are done so they are not garbage collected
+        self._callback_tasks: set[asyncio.Task] = set()
+        self._changed = asyncio.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Starts the dispatcher as asyncio task if it is not running yet."""
+        if not self.is_running:
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self) -> None:
+        """Stops the dispatcher, the scheduled jobs are kept and running callbacks finish."""
+        if self.is_running:
+            self._task.cancel()
+
+    def schedule(self, key: Hashable, time_of_day: str, timezone: str | None = None) -> None:
+        """
+        Schedules the job with the given key to run every day at the given time, replacing an existing job.
+
+        Args:
+            key: identifies the job, e.g. a channel id
+            time_of_day: time in format `"HH:MM"`
+            timezone (default: DEFAULT_TIMEZONE from config.py): IANA name of the timezone of `time_of_day`
+        """
+        self._push(key, time_of_day, timezone, next_fire_time(time_of_day, _time.time(), timezone))
+
+        # Wake up the dispatcher if the job runs before the one it is waiting for
+        if self._heap[0][1] == self._jobs[key].sequence:
+            self._changed.set()
+
+    def unschedule(self, key: Hashable) -> None:
+        """Removes the job with the given key if it exists."""
+        self._jobs.pop(key, None)
+
+    def job(self, key: Hashable) -> tuple[str, str | None] | None:
+        """
+        Looks up the settings of the job with the given key.
+
+        Returns:
+            `(time_of_day, timezone)` or `None` if no job with this key is scheduled.
+        """
+        job = self._jobs.get(key)
+        return (job.time_of_day, job.timezone) if job is not None else None
+
+    def next_run(self, key: Hashable) -> float | None:
+        """Unix timestamp of the next run of the job with the given key or `None` if it is not scheduled."""
+        job = self._jobs.get(key)
+        return job.next_run if job is not None else None
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def _push(self, key: Hashable, time_of_day: str, timezone: str | None, next_run: float) -> None:
+        sequence = next(self._sequence)
+        self._jobs[key] = _Job(time_of_day, timezone, next_run, sequence)
+        heapq.heappush(self._heap, (next_run, sequence, key))
+
+        if len(self._heap) > 2 * len(self._jobs) + 64:
+            self._heap = [(job.next_run, job.sequence, key) for key, job in self._jobs.items()]
+            heapq.heapify(self._heap)
+
+    def _is_current(self, entry: tuple[float, int, Hashable]) -> bool:
+        job = self._jobs.get(entry[2])
+        return job is not None and job.sequence == entry[1]
+
+    async def _run(self):
+        while True:
+            self._changed.clear()
+            while self._heap and not self._is_current(self._heap[0]):
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                await self._changed.wait()
+                continue
+            if not await self._sleep_until(self._heap[0][0]):
+                # A job was scheduled before the one waited for
+                continue
+
+            now = _time.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if not self._is_current(entry):
+                    continue
+                run_time, _, key = entry
+                job = self._jobs[key]
+                scheduler_lag.observe(now - run_time)
+                due.append((key, datetime.fromtimestamp(run_time, datetime_tools.get_timezone(job.timezone))))
+                # Count from now, so runs missed while the process was suspended are not repeated
+                self._push(key, job.time_of_day, job.timezone, next_fire_time(job.time_of_day, now, job.timezone))
+
+            if not due:
+                continue
+            task = asyncio.create_task(self._run_callback(due))
+            self._callback_tasks.add(task)
+            task.add_done_callback(self._callback_tasks.discard)
+
+    async def _run_callback(self, due: list[tuple[Hashable, datetime]]):
+        try:
+            await self.callback(due)
+        except Exception:
+            traceback.print_exc()
+
+    async def _sleep_until(self, timestamp: float) -> bool:
+        """
+        Sleeps until the given unix timestamp is reached.
+
+        Returns:
+            `True` if the timestamp was reached; `False` if a job was scheduled meanwhile that runs earlier.
+        """
+        # Loop in case the monotonic clock used by asyncio and the wall clock drifted apart
+        while (remaining := timestamp - _time.time()) > 0:
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+                return False
+            except asyncio.TimeoutError:
+                pass
+        return True
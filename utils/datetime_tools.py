@@ -1,5 +1,8 @@
-from datetime import datetime
-from config import DATE_FORMAT
+import calendar
+import functools
+from datetime import date as Date, datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from config import DATE_FORMAT, DEFAULT_TIMEZONE
 
 def check_date_format(date: str):
     """
@@ -19,6 +22,70 @@ def check_date_format(date: str):
     return res
 
 
+def check_time_format(time_of_day: str) -> bool:
+    """
+    Checks if the given time of day has the format `"HH:MM"`.
+
+    Args:
+        time_of_day: the time as string
+
+    Returns:
+        `True` if the time is in the correct format, `False` else.
+    """
+    try:
+        datetime.strptime(time_of_day, "%H:%M")
+    except ValueError:
+        return False
+    return len(time_of_day) == 5
+
+
+def check_timezone(timezone: str) -> bool:
+    """
+    Checks if the given name is a known IANA timezone like `"Europe/Berlin"`.
+
+    Args:
+        timezone: the name of the timezone
+
+    Returns:
+        `True` if the timezone exists, `False` else.
+    """
+    try:
+        get_timezone(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+
+@functools.cache
+def get_timezone(timezone: str | None = None) -> ZoneInfo:
+    """
+    Gets the timezone with the given IANA name.
+
+    Args:
+        timezone (default: DEFAULT_TIMEZONE from config.py): the name of the timezone
+
+    Raises:
+        ZoneInfoNotFoundError: if no timezone with this name exists.
+
+    Returns:
+        `ZoneInfo` object of the timezone.
+    """
+    return ZoneInfo(timezone or DEFAULT_TIMEZONE)
+
+
+def current_date(timezone: str | None = None) -> Date:
+    """
+    Gets the current date in the given timezone.
+
+    Args:
+        timezone (default: DEFAULT_TIMEZONE from config.py): IANA name of the timezone
+
+    Returns:
+        Todays date in the timezone.
+    """
+    return datetime.now(get_timezone(timezone)).date()
+
+
 def string_to_datetime(date_str: str):
     """
     Parses a date string to datetime format.
@@ -33,6 +100,33 @@ def string_to_datetime(date_str: str):
     return date
 
 
+def string_to_date(date_str: str) -> Date:
+    """
+    Parses a date string to a date object.
+
+    Args:
+        date_str: the date as string with format as specified in config.py
+
+    Returns:
+        Date object with the given date
+    """
+    return string_to_datetime(date_str).date()
+
+
+def date_to_string(date: Date) -> str:
+    """
+    Formats a date object as string.
+
+    Args:
+        date: the date as date or datetime object
+
+    Returns:
+        Given date as string in format specified in config.py
+    """
+    # `strftime` does not pad years below 1000 on every platform, but parsing requires four digits
+    return date.strftime(DATE_FORMAT.replace("%Y", f"{date.year:04d}"))
+
+
 def format_date_string(date_str: str):
     """
     Parses a date string to string with format specified in config.py.
@@ -43,15 +137,90 @@ def format_date_string(date_str: str):
     Returns:
         Given date as string in format specified in config.py
     """
-    date = string_to_datetime(date_str)
-    return datetime.strftime(date, DATE_FORMAT)
+    return date_to_string(string_to_datetime(date_str))
+
+
+def celebration_date(month: int, day: int, year: int) -> Date:
+    """
+    Gets the date a birthday with given month and day is celebrated in the given year.
+
+    Birthdays on 29 February are celebrated on 28 February in years that are not leap years.
+
+    Args:
+        month: month of the birthday
+        day: day of the birthday
+        year: the year to get the date for
+
+    Returns:
+        The date of the birthday in the given year.
+    """
+    if (month, day) == (2, 29) and not calendar.isleap(year):
+        day = 28
+    return Date(year, month, day)
+
+
+def celebrated_yeardays(today: Date) -> list[tuple[int, int]]:
+    """
+    Lists the `(month, day)` keys of all birthdays that are celebrated on the given day.
 
-def days_until_yearday(date: datetime|str):
+    Args:
+        today: the day to look up
+
+    Returns:
+        List with the key of the given day and `(2, 29)` on 28 February of non-leap years.
+    """
+    keys = [(today.month, today.day)]
+    if keys[0] == (2, 28) and not calendar.isleap(today.year):
+        keys.append((2, 29))
+    return keys
+
+
+# Across all timezones at most three dates are "today" at the same time
+@functools.lru_cache(maxsize=4)
+def _days_left_table(today: Date) -> list[int]:
+    """
+    Calculates the number of days from today until every day of the year.
+
+    Returns:
+        List with the days left until the birthday with given month and day at index `month * 32 + day`.
+    """
+    table = [0] * (13 * 32)
+    for month in range(1, 13):
+        # 2000 is a leap year, so 29 February is included
+        for day in range(1, calendar.monthrange(2000, month)[1] + 1):
+            next_date = celebration_date(month, day, today.year)
+            if next_date < today:
+                next_date = celebration_date(month, day, today.year + 1)
+            table[month * 32 + day] = (next_date - today).days
+    return table
+
+
+def days_until_yeardays(months: list[int], days: list[int], today: Date | None = None) -> list[int]:
+    """
+    Calculates the number of days until the given days in year for a whole column of dates at once.
+
+    The days left until every day of the year are calculated once per day,
+    so every entry only costs a lookup instead of parsing and constructing dates.
+
+    Args:
+        months: the months of the dates
+        days: the days of the dates (same length as `months`)
+        today: the day to count from, defaults to today in DEFAULT_TIMEZONE from config.py
+
+    Returns:
+        Days until the given dates as list of integers.
+    """
+    table = _days_left_table(today or current_date())
+    return [table[month * 32 + day] for month, day in zip(months, days)]
+
+
+def days_until_yearday(date: Date|datetime|str, today: Date | None = None):
     """
     Calculates the number of days until the given date in year.
 
     Args:
-        date: the date as string or datetime object
+        date: the date as string, date or datetime object
+        today: the day to count from, defaults to today in DEFAULT_TIMEZONE from config.py
     
     Returns:
         Days until the given date as integer.
@@ -61,16 +230,7 @@ def days_until_yearday(date: datetime|str):
         # Parse from string
         date = string_to_datetime(date)
 
-    # Set year to current year
-    today = datetime.today().date()
-    date = datetime(today.year,date.month,date.day).date()
-
-    # Check if birthday is this year or next year
-    # Adjust year accordingly
-    if (date - today).days < 0:
-        date = datetime(today.year + 1,date.month,date.day).date()
-    
-    return (date - today).days
+    return _days_left_table(today or current_date())[date.month * 32 + date.day]
 
 def has_birthday_today(date: datetime|str):
     """
@@ -86,6 +246,4 @@ def has_birthday_today(date: datetime|str):
         # Parse from string
         date = string_to_datetime(date)
 
-    today = datetime.today()
-
-    return (date.month == today.month) and (date.day == today.day)
\ No newline at end of file
+    return (date.month, date.day) in celebrated_yeardays(current_date())
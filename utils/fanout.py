@@ -0,0 +1,143 @@
+import asyncio
+import math
+import time
+import traceback
+from dataclasses import dataclass, field
+
+from config import PUBLISH_RATE_LIMIT, PUBLISH_SAVE_INTERVAL, PUBLISH_WORKERS
+from utils.metrics import messages as messages_metric, send_latency
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing `rate` acquisitions per second with bursts of up to `capacity`.
+
+    Waiting coroutines are served in the order they called `acquire`.
+    """
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Waits until a token is available and takes it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Shared by all fan-outs of this process, so overlapping fan-outs together stay below the rate limit
+publish_limiter = TokenBucket(PUBLISH_RATE_LIMIT)
+
+
+@dataclass
+class FanOutReport:
+    """Statistics of one fan-out run."""
+    sent: int = 0
+    failed: int = 0
+    duration: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+    # Ids of the channels the message was sent to successfully
+    delivered: list[int] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """Sent messages per second."""
+        return self.sent / self.duration if self.duration > 0 else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """Send latency (seconds) below which `percent` percent of the sent messages lie."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+    def format(self) -> str:
+        return (f"sent: {self.sent}, failed: {self.failed}, duration: {self.duration:.2f} s, "
+                f"throughput: {self.throughput:.1f} msg/s, "
+                f"p50: {self.percentile(50) * 1000:.0f} ms, p99: {self.percentile(99) * 1000:.0f} ms")
+
+
+async def fan_out(messages: list[tuple[object, str | list[str]]],
+                  workers: int = PUBLISH_WORKERS,
+                  limiter: TokenBucket | None = None,
+                  on_delivered=None,
+                  save_interval: float = PUBLISH_SAVE_INTERVAL) -> FanOutReport:
+    """
+    Sends the given messages with a bounded number of concurrent sends and a rate limit.
+
+    Args:
+        messages: list of `(channel, content)` tuples, a channel is anything with an `id` and
+                  an asynchronous `send(content)` method (e.g. disnake.abc.GuildChannel).
+                  The content can be a list of messages that are sent to the channel in this order,
+                  the channel only counts as delivered if all of them were sent.
+        workers: maximum number of messages that are sent at the same time
+        limiter: rate limiter every send has to acquire a token from;
+                 defaults to `publish_limiter` allowing `PUBLISH_RATE_LIMIT` messages per second for the whole process
+        on_delivered: optional coroutine function awaited with lists of ids of the channels delivered to
+                      while the fan-out is running, e.g. to save the progress
+        save_interval (default: PUBLISH_SAVE_INTERVAL from config.py): minimum number of seconds between two
+                      calls of `on_delivered`, the rest is passed when the fan-out is done
+
+    Returns:
+        `FanOutReport` with number of sent and failed messages, the send latencies and the channels sent to.
+    """
+    limiter = limiter or publish_limiter
+    report = FanOutReport()
+    queue = asyncio.Queue()
+    for message in messages:
+        queue.put_nowait(message)
+    # Delivered channels not yet passed to `on_delivered`
+    pending: list[int] = []
+    last_flush = time.monotonic()
+
+    async def flush():
+        nonlocal last_flush
+        last_flush = time.monotonic()
+        batch = pending[:]
+        pending.clear()
+        if batch and on_delivered is not None:
+            await on_delivered(batch)
+
+    async def worker():
+        while not queue.empty():
+            channel, content = queue.get_nowait()
+            for part in [content] if isinstance(content, str) else content:
+                await limiter.acquire()
+                start = time.monotonic()
+                try:
+                    await channel.send(part)
+                except Exception:
+                    report.failed += 1
+                    messages_metric.inc(result="failed")
+                    print(f"Publishing to channel {channel.id} failed:")
+                    traceback.print_exc()
+                    # The remaining parts would make no sense without this one
+                    break
+                latency = time.monotonic() - start
+                report.sent += 1
+                report.latencies.append(latency)
+                messages_metric.inc(result="sent")
+                send_latency.observe(latency)
+            else:
+                report.delivered.append(channel.id)
+                pending.append(channel.id)
+                if time.monotonic() - last_flush >= save_interval:
+                    await flush()
+
+    start = time.monotonic()
+    await asyncio.gather(*[worker() for _ in range(min(workers, len(messages)))])
+    await flush()
+    report.duration = time.monotonic() - start
+
+    return report
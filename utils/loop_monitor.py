@@ -0,0 +1,21 @@
+import asyncio
+import time
+
+from utils.metrics import event_loop_lag
+
+
+async def monitor_event_loop_lag(interval: float = 0.1):
+    """
+    Loop to measure how long the event loop is blocked.
+
+    Sleeps `interval` seconds and records how much later than planned the loop resumed it
+    in the `event_loop_lag` metric. Long blocking calls (e.g. file I/O on the event loop) show up in the upper buckets.
+    This is executed as task in the handler for the 'on_ready' bot event.
+
+    Args:
+        interval: number of seconds between two measurements
+    """
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(0.0, time.monotonic() - start - interval))
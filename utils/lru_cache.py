@@ -0,0 +1,49 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry once `maxsize` entries are stored.
+
+    Counts hits and misses of `get` to see how effective the cache is.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Looks up the value for the given key and marks it as most recently used.
+
+        Returns:
+            The cached value or `None` if the key is not cached.
+        """
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._entries[key]
+
+    def put(self, key, value) -> None:
+        """Stores the value and evicts the least recently used entry if the cache is full."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, predicate) -> None:
+        """Removes all entries whose key matches the given predicate."""
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def info(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0.0
+        return f"hits: {self.hits}, misses: {self.misses}, hit ratio: {ratio:.0%}, size: {len(self)}/{self.maxsize}"
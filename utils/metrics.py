@@ -0,0 +1,210 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
+from config import METRICS_HOST, METRICS_LOG_INTERVAL, METRICS_PORT
+
+# Upper bounds (seconds) of the histogram buckets, the last bucket collects everything above
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class LatencyHistogram:
+    """Counts observed latencies in fixed buckets."""
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound),
+                     len(self.buckets))
+        self.counts[index] += 1
+        self.total += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+
+class Counter:
+    """Counts events per combination of label values."""
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.values: dict[tuple[tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(key)} {value:g}" for key, value in self.values.items())
+        return lines
+
+
+class Timer:
+    """Histogram of durations per combination of label values."""
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.histograms: dict[tuple[tuple[str, str], ...], LatencyHistogram] = {}
+
+    def observe(self, seconds: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram(self.buckets)
+        histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager observing how long its block took."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, histogram in self.histograms.items():
+            # Prometheus buckets are cumulative
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, le=f'{bound:g}')} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, le='+Inf')} {histogram.total}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {histogram.sum:g}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {histogram.total}")
+        return lines
+
+
+class _Collected:
+    """Value read from somewhere else each time the metrics are rendered, e.g. the size of a cache."""
+    def __init__(self, name: str, documentation: str, metric_type: str, read):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.read = read
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}",
+                f"{self.name} {self.read():g}"]
+
+
+class Registry:
+    """All metrics of the process, rendered in the Prometheus text format."""
+    def __init__(self):
+        self._metrics: dict[str, Counter | Timer | _Collected] = {}
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def timer(self, name: str, documentation: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Timer:
+        return self._register(Timer(name, documentation, buckets))
+
+    def collect(self, name: str, documentation: str, read, metric_type: str = "gauge") -> None:
+        """
+        Registers a value that is read by calling `read` whenever the metrics are rendered.
+
+        Args:
+            read: function without arguments returning the current value
+            metric_type: `"gauge"` or `"counter"`
+        """
+        self._register(_Collected(name, documentation, metric_type, read))
+
+    def render(self) -> str:
+        """Formats all metrics in the Prometheus text exposition format."""
+        return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+
+def _format_labels(key: tuple[tuple[str, str], ...], **extra) -> str:
+    labels = [*key, *extra.items()]
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(str(value))}"' for name, value in labels) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+registry = Registry()
+
+# Runner of the metrics endpoint once it is started
+_runner = None
+
+command_duration = registry.timer(
+    "bot_command_duration_seconds", "Duration of the slash command handlers by command and status.")
+storage_call_duration = registry.timer(
+    "bot_storage_call_duration_seconds", "Duration of the storage backend calls (incl. waiting for a thread).")
+store_load_duration = registry.timer(
+    "bot_store_load_duration_seconds", "Duration of reading all birthdays from the storage backend.")
+scheduler_lag = registry.timer(
+    "bot_scheduler_lag_seconds", "Delay between the planned and the actual run of the daily publish.")
+send_latency = registry.timer(
+    "bot_send_latency_seconds", "Duration of sending one daily birthday message to Discord.")
+messages = registry.counter(
+    "bot_messages_total", "Daily birthday messages by result (sent or failed).")
+shared_renders = registry.counter(
+    "bot_daily_renders_avoided_total", "Due channels of the daily publish that reused the tables of their guild.")
+event_loop_lag = registry.timer(
+    "bot_event_loop_lag_seconds", "How much later than planned the event loop resumed the lag monitor.")
+
+
+async def serve_metrics(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """
+    Serves the metrics in the Prometheus text format at `http://host:port/metrics`.
+
+    This is executed in the handler for the 'on_ready' bot event, calling it again (e.g. on reconnect)
+    keeps the running endpoint. If the port cannot be bound (e.g. it is taken by another process),
+    the error is logged and the next call tries again.
+
+    Args:
+        host (default: METRICS_HOST from config.py): address to listen on
+        port (default: METRICS_PORT from config.py): port to listen on
+    """
+    global _runner
+    if _runner is not None:
+        return
+
+    from aiohttp import web
+
+    async def handle(_request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        print(f"Metrics could not be served at http://{host}:{port}/metrics ({e}).")
+        await runner.cleanup()
+        return
+    _runner = runner
+    print(f"Serving metrics at http://{host}:{port}/metrics")
+
+
+async def log_metrics(interval: int = METRICS_LOG_INTERVAL):
+    """
+    Loop to print all metrics every `interval` seconds.
+
+    This is executed as task in the handler for the 'on_ready' bot event.
+
+    Args:
+        interval (default: METRICS_LOG_INTERVAL from config.py): number of seconds between two printouts
+    """
+    while True:
+        await asyncio.sleep(interval)
+        print("----------------------")
+        print("Metrics:\n")
+        print(registry.render(), end="")
+        print("----------------------")
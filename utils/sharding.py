@@ -0,0 +1,72 @@
+import os
+
+from config import SHARD_COUNT, SHARD_IDS
+
+
+def shard_id_for(guild_id: int, shard_count: int) -> int:
+    """
+    Calculates the shard Discord sends the events of the given guild to.
+
+    Args:
+        guild_id: id of the guild
+        shard_count: total number of shards
+
+    Returns:
+        The id of the shard, between 0 and `shard_count - 1`.
+    """
+    return (guild_id >> 22) % shard_count
+
+
+def parse_shard_ids(value: str) -> list[int] | None:
+    """
+    Parses a list of shard ids like `"0,2"` or a range like `"0-3"` (both can be combined: `"0-3,8"`).
+
+    Returns:
+        Sorted list of shard ids or `None` for an empty string.
+    """
+    shard_ids = set()
+    for part in filter(None, (part.strip() for part in value.split(","))):
+        first, _, last = part.partition("-")
+        shard_ids.update(range(int(first), int(last or first) + 1))
+    return sorted(shard_ids) or None
+
+
+class ShardRange:
+    """
+    The shards this process runs and with them the guilds it owns.
+
+    Without a shard count the process runs one unsharded bot and owns all guilds.
+    Without shard ids it runs all shards and owns all guilds as well,
+    otherwise it owns only the guilds whose events Discord sends to its shards.
+    """
+    def __init__(self, shard_count: int = 0, shard_ids: list[int] | None = None):
+        if shard_ids and not shard_count:
+            raise ValueError("Shard ids need a shard count")
+        if shard_ids and not all(0 <= shard_id < shard_count for shard_id in shard_ids):
+            raise ValueError(f"Shard ids {shard_ids} are out of range for {shard_count} shards")
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+
+    @classmethod
+    def from_environment(cls) -> "ShardRange":
+        """Reads the shards from the environment variables `SHARD_COUNT` and `SHARD_IDS`, defaults from config.py."""
+        return cls(int(os.environ.get("SHARD_COUNT", SHARD_COUNT)),
+                   parse_shard_ids(os.environ.get("SHARD_IDS", SHARD_IDS)))
+
+    @property
+    def is_sharded(self) -> bool:
+        return self.shard_count > 0
+
+    @property
+    def is_partial(self) -> bool:
+        """`True` if other processes run the remaining shards."""
+        return self.shard_ids is not None and len(self.shard_ids) < self.shard_count
+
+    def owns(self, guild_id: int) -> bool:
+        """Checks if the events of the given guild are received by this process."""
+        return not self.is_partial or shard_id_for(guild_id, self.shard_count) in self.shard_ids
+
+    def __repr__(self) -> str:
+        if not self.is_sharded:
+            return "unsharded"
+        return f"shards {self.shard_ids if self.is_partial else 'all'} of {self.shard_count}"
@@ -1,147 +1,250 @@
-import asyncio
-import functools
-import schedule
+from datetime import date as Date, datetime
 
 from disnake.abc import GuildChannel
 
-from datetime import datetime
 from pprint import pprint
 from daos.subscriptions import Subscriptions
+from utils import datetime_tools
+from utils.daily_dispatcher import DailyDispatcher
+from utils.metrics import registry
 
 
-# Dictionary to store the jobs per channel id to be able to unsubscribe and therefore cancel the job for the unsubscribing channel
-_scheduled_subscription_jobs = {}
+# Dictionary to store the subscribed channels per channel id to be able to unsubscribe
+_subscribed_channels: dict[int, GuildChannel] = {}
 
+# Timezones of the subscriptions per guild id and channel id, "today" in commands is determined in them
+_timezones_by_guild: dict[int, dict[int, str]] = {}
 
-# Following the recipe from https://realpython.com/primer-on-python-decorators/#both-please-but-never-mind-the-bread
-def run_daily_at(time=datetime.now().time().strftime("%H:%M:00")):
+# Days ahead of a birthday a reminder is added to the daily message per channel id, channels without are left out
+_reminder_days: dict[int, tuple[int, ...]] = {}
+
+# Date of the last successful publish per channel id, a channel is published to at most once per day
+_last_published: dict[int, Date] = {}
+
+# Ids of the channels a publish is running for
+_publishing: set[int] = set()
+
+# Coroutine function publishing to the due channels, set by `start_dispatcher`
+_publish = None
+
+
+# Dispatcher running the publish function for every subscribed channel once a day at the channel's time
+_dispatcher = DailyDispatcher(lambda due: _run_for_due_channels(due))
+
+registry.collect("bot_subscriptions", "Number of subscribed channels.", lambda: len(_subscribed_channels))
+
+
+def is_scheduled(channel_id: int) -> bool:
     """
-    Removes and reschedules a function using the scheduler package.
+    Checks if the channel with the given id is subscribed.
 
-    This is an ugly bugfix to work around the exception:
-        RuntimeError('cannot reuse already awaited coroutine')
-    
     Args:
-        time: time to that the function should be rescheduled. Defaults to the current time when decorator is invoked.
+        channel_id: The id of the channel to look up in the dictionary of subscribed channels
 
     Returns:
-        A decorator function that expects the wrapped function to pass a discord.py GuildChannel as first positional argument.
+        `True` if the entry exists; `False` else
     """
-    def decorator(func):
-        @functools.wraps(func)
-        async def wrapper(guild_channel: GuildChannel, *args, **kwargs):
-            value = await func(guild_channel, *args, **kwargs)
-            # Remove and cancel old job
-            _cancel_task(guild_channel)
-            # Schedule new job
-            _schedule_task(guild_channel, decorator(func), time)
+    return channel_id in _subscribed_channels
 
-            return value
 
-        return wrapper
+def get_settings(channel_id: int) -> tuple[str, str] | None:
+    """
+    Looks up the publish settings of the channel with the given id.
 
-    return decorator
+    Returns:
+        `(publish_time, timezone)` or `None` if the channel is not subscribed.
+    """
+    return _dispatcher.job(channel_id)
 
 
-def is_scheduled(channel_id: int) -> bool:
+def guild_timezone(guild_id: int) -> str | None:
     """
-    Checks if a job exists that is associated to the given `guild_channel`.
+    Gets the timezone of a subscription in the given guild.
 
-    This is an ugly bugfix to work around the exception:
-        RuntimeError('cannot reuse already awaited coroutine')
-    
-    Args:
-        channel_id: The id of the channel to look up in the dictionary of scheduled jobs
+    Returns:
+        IANA name of the timezone or `None` if no channel of the guild is subscribed.
+    """
+    timezones = _timezones_by_guild.get(guild_id)
+    return next(iter(timezones.values())) if timezones else None
+
+
+def get_reminder_days(channel_id: int) -> tuple[int, ...]:
+    """
+    Looks up the days ahead of a birthday a reminder is added to the daily message of the channel.
 
     Returns:
-        `True` if the entry exists; `False` else
+        Numbers of days in ascending order, empty if no reminders are set.
     """
-    return channel_id in _scheduled_subscription_jobs
+    return _reminder_days.get(channel_id, ())
 
 
-def new_task(guild_channel: GuildChannel, func, time: str):
+async def set_reminder_days(guild_channel: GuildChannel, reminder_days: tuple[int, ...]):
     """
-    Creates new job and stores is it to be remembered on restart.
-    
-    Calls subscription repo to save the entry persistently.
-    Prints out the resulting list of current scheduled jobs.
+    Sets the days ahead of a birthday a reminder is added to the daily message of the subscribed channel.
+
+    Calls subscription repo to save them persistently.
 
     Args:
-        guild_channel: disnake.abc.GuildChannel to be passed to func
-        func: the function that is scheduled as asynchronous task
-        time: time in string format that the scheduler uses to schedule the task
+        guild_channel: disnake.abc.GuildChannel
+        reminder_days: numbers of days in ascending order, empty to remove the reminders
     """
-    _schedule_task(guild_channel, func, time)
-
-    Subscriptions.save(guild_channel)
+    _set_reminder_days(guild_channel.id, reminder_days)
 
-    print("----------------------")
-    print("Current jobs (channel_id: job_details):\n")
-    pprint(_scheduled_subscription_jobs)
-    print("----------------------")
+    await Subscriptions.save_reminder_days(guild_channel, reminder_days)
 
 
-def remove_task(guild_channel: GuildChannel):
+async def new_task(guild_channel: GuildChannel, publish_time: str, timezone: str):
     """
-    Removes the task associated to the given guild_channel.
+    Schedules publishing to the channel every day at the given time, replacing its settings if it is subscribed.
 
-    Calls subscription repo to delete the entry.
-    Prints out the resulting list of current scheduled jobs.
+    Calls subscription repo to save the entry persistently.
+    Prints out the resulting list of current subscribed channels.
 
     Args:
         guild_channel: disnake.abc.GuildChannel
+        publish_time: time of day in format `"HH:MM"`
+        timezone: IANA name of the timezone of `publish_time`
     """
-    _cancel_task(guild_channel)
+    _add(guild_channel, publish_time, timezone)
 
-    Subscriptions.delete(guild_channel)
+    await Subscriptions.save(guild_channel, publish_time, timezone)
 
-    print("----------------------")
-    print("Current jobs (channel_id: job_details):\n")
-    pprint(_scheduled_subscription_jobs)
-    print("----------------------")
+    _print_subscribed_channels()
 
 
-async def run_scheduled_jobs(sleep=1):
+def restore_tasks(subscriptions: list[tuple[GuildChannel, str, str, Date | None, tuple[int, ...]]]):
     """
-    Loop to run jobs as soon as the scheduler marks them as pending.
-    
-    This is executed as task in the handler for the 'on_ready' bot event.
+    Schedules publishing to already saved subscriptions.
+
+    In contrast to `new_task` the subscriptions are not saved again.
+    Prints out the resulting list of current subscribed channels.
 
     Args:
-        sleep: number of seconds to wait between retries to run pending jobs.
+        subscriptions: list of `(channel, publish_time, timezone, last_published, reminder_days)` tuples
     """
-    while True:
-        schedule.run_pending()
-        await asyncio.sleep(sleep)
+    for guild_channel, publish_time, timezone, last_published, reminder_days in subscriptions:
+        _add(guild_channel, publish_time, timezone)
+        _set_reminder_days(guild_channel.id, reminder_days)
+        if last_published is not None and last_published > _last_published.get(guild_channel.id, Date.min):
+            _last_published[guild_channel.id] = last_published
+
+    _print_subscribed_channels()
 
 
-def _schedule_task(guild_channel: GuildChannel, func, time: str):
+async def remove_task(guild_channel: GuildChannel):
     """
-    Schedules new job for the given func that is executed with `guild_channel` as parameter at the given time.
-    
-    Stores channel_id and job-instance as key-value pair in a global dictionary `scheduled_subscription_jobs` for later cancelation.
-    Prints out the resulting list of current scheduled jobs.
-    The func is scheduled as asynchronous task so it has to be awaited or run as task itself!
+    Removes the given guild_channel from the channels the daily dispatcher publishes to.
+
+    Calls subscription repo to delete the entry.
+    Prints out the resulting list of current subscribed channels.
 
     Args:
-        guild_channel: disnake.abc.GuildChannel to be passed to func
-        func: the function that is scheduled as asynchronous task
-        time: time in string format that the scheduler uses to schedule the task
+        guild_channel: disnake.abc.GuildChannel
     """
-    job = schedule.every().day.at(time).do(asyncio.create_task, func(guild_channel))
-    # job = schedule.every(10).seconds.do(asyncio.create_task, func(guild_channel)) # uncomment for debugging
+    _subscribed_channels.pop(guild_channel.id, None)
+    _last_published.pop(guild_channel.id, None)
+    _reminder_days.pop(guild_channel.id, None)
+    _dispatcher.unschedule(guild_channel.id)
+    timezones = _timezones_by_guild.get(guild_channel.guild.id, {})
+    timezones.pop(guild_channel.id, None)
+    if not timezones:
+        _timezones_by_guild.pop(guild_channel.guild.id, None)
+
+    await Subscriptions.delete(guild_channel)
 
-    _scheduled_subscription_jobs[guild_channel.id] = job
+    _print_subscribed_channels()
 
 
-def _cancel_task(guild_channel: GuildChannel):
+def start_dispatcher(func):
     """
-    Removes the task associated to the given guild_channel in the dictionary and cancels it from scheduler.
+    Starts the daily dispatcher that runs `func` with the channels whose publish time is reached.
 
-    Prints out the resulting list of current scheduled jobs.
+    This is executed in the handler for the 'on_ready' bot event. Calling it again (e.g. on reconnect)
+    keeps the running dispatcher.
 
     Args:
-        guild_channel: disnake.abc.GuildChannel
+        func: coroutine function that expects a list of `(disnake.abc.GuildChannel, date)` tuples,
+              the date is todays date in the timezone of the channel's subscription, and the keyword argument
+              `on_delivered`: a coroutine function it awaits with batches of ids of the channels published to
+              while it is running.
+    """
+    global _publish
+
+    _publish = func
+    _dispatcher.start()
+
+
+async def catch_up_missed_runs():
+    """
+    Publishes to the subscribed channels whose publish time already passed today without a successful publish,
+    e.g. because the bot was offline at that time.
+
+    This is executed in the handler for the 'on_ready' bot event after the subscriptions are restored.
+    Channels that were published to today already are skipped, so running it again (e.g. on reconnect) is harmless.
+    """
+    missed = []
+    for channel_id, guild_channel in _subscribed_channels.items():
+        publish_time, timezone = _dispatcher.job(channel_id)
+        now = datetime.now(datetime_tools.get_timezone(timezone))
+        if now.strftime("%H:%M") >= publish_time:
+            missed.append((guild_channel, now.date()))
+
+    await _publish_once(missed)
+
+
+def stop_dispatcher():
+    """Cancels the daily dispatcher."""
+    _dispatcher.cancel()
+
+
+def _add(guild_channel: GuildChannel, publish_time: str, timezone: str):
+    _subscribed_channels[guild_channel.id] = guild_channel
+    _timezones_by_guild.setdefault(guild_channel.guild.id, {})[guild_channel.id] = timezone
+    _dispatcher.schedule(guild_channel.id, publish_time, timezone)
+
+
+def _set_reminder_days(channel_id: int, reminder_days: tuple[int, ...]):
+    if reminder_days:
+        _reminder_days[channel_id] = reminder_days
+    else:
+        _reminder_days.pop(channel_id, None)
+
+
+async def _run_for_due_channels(due: list[tuple[int, datetime]]):
+    """Runs the publish function once with all due channels and the date of the run in their timezone."""
+    await _publish_once([(_subscribed_channels[channel_id], run_time.date())
+                         for channel_id, run_time in due if channel_id in _subscribed_channels])
+
+
+async def _publish_once(channels: list[tuple[GuildChannel, Date]]):
+    """
+    Runs the publish function with the channels that were not published to on the given day yet.
+
+    The date of every successful publish is saved in batches while the messages are sent,
+    so it is neither repeated by a later catch-up nor after a restart, even if the process stops during the run.
     """
-    job = _scheduled_subscription_jobs.pop(guild_channel.id)
-    schedule.cancel_job(job)
+    channels = [(guild_channel, today) for guild_channel, today in channels
+                if _last_published.get(guild_channel.id, Date.min) < today and guild_channel.id not in _publishing]
+    if not channels or _publish is None:
+        return
+
+    dates = {guild_channel.id: today for guild_channel, today in channels}
+
+    async def mark_published(channel_ids: list[int]):
+        published = [(channel_id, dates[channel_id]) for channel_id in channel_ids]
+        _last_published.update(published)
+        await Subscriptions.mark_published(published)
+
+    _publishing.update(dates)
+    try:
+        await _publish(channels, on_delivered=mark_published)
+    finally:
+        _publishing.difference_update(dates)
+
+
+def _print_subscribed_channels():
+    print("----------------------")
+    print("Current subscriptions (channel_id: channel, publish time, timezone):\n")
+    pprint({channel_id: (channel, *_dispatcher.job(channel_id))
+            for channel_id, channel in _subscribed_channels.items()})
+    print("----------------------")